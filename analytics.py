@@ -1,58 +1,51 @@
 # analytics.py
 import streamlit as st
-from firebase_init import db
+from firebase_init import db, Query
 import pandas as pd
 import datetime
 import plotly.express as px
 import plotly.graph_objects as go
-from menu import menu  # Import menu to get price and cost data
+from branch_directory import get_branch_directory
+from branch_inventory import get_branch_inventory, low_stock_thresholds, threshold_for
+from sales_rollups import get_rollup
+from sales_metrics import order_totals
+from order_times import day_bounds
+from order_lines import build_order_lines
 
 def analytics_dashboard():
     st.title("Analytics Dashboard")
 
-    # Branch Selection
-    branches_ref = db.collection("branches").stream()
-    branches = [{"Branch Name": b.to_dict()["cafe_name"], "Branch ID": b.id} for b in branches_ref]
+    # Branch Selection from the shared branch directory
+    directory = get_branch_directory()
+    branch_names = directory.names()
 
-    if not branches:
+    if not branch_names:
         st.warning("No branches available. Please contact admin.")
         return  # Exit the function if no branches are available
     else:
-        branch_names = [branch["Branch Name"] for branch in branches]
         selected_branch_name = st.selectbox("Select Branch for Analytics", branch_names)
-        selected_branch_id = next(
-            branch["Branch ID"] for branch in branches if branch["Branch Name"] == selected_branch_name
-        )
+        selected_branch_id = directory.id_for(selected_branch_name)
 
     # Real-Time Monitoring
     st.subheader(f"Real-Time Monitoring for {selected_branch_name}")
 
-    # Fetch Orders for the Selected Branch
-    orders_ref = db.collection("orders").where("branch_id", "==", selected_branch_id).stream()
-    orders = []
-    for o in orders_ref:
-        order_data = o.to_dict()
-        order_time = order_data["order_time"]
-        customer = order_data.get("customer", "Unknown")
-        items = order_data.get("items", [])
-        for item in items:
-            coffee = item["coffee"]
-            quantity = item["quantity"]
-            price_per_item = menu[coffee]["price"]
-            total_price = price_per_item * quantity
-            orders.append({
-                "Order Time": order_time,
-                "Coffee": coffee,
-                "Quantity": quantity,
-                "Price (RM)": total_price,
-                "Customer": customer
-            })
-
-    if orders:
-        # Convert orders to DataFrame
-        df_orders = pd.DataFrame(orders)
-        df_orders["Order Time"] = pd.to_datetime(df_orders["Order Time"])
-        df_orders["Price (RM)"] = df_orders["Price (RM)"].astype(float)
+    # Fetch the latest orders for the selected branch (the dashboard totals come from rollups)
+    orders_ref = db.collection("orders") \
+        .where("branch_id", "==", selected_branch_id) \
+        .order_by("order_time", direction=Query.DESCENDING) \
+        .limit(10) \
+        .stream()
+    df_lines = build_order_lines(orders_ref)
+
+    if not df_lines.empty:
+        # Keep the display columns used by the tables below
+        df_orders = df_lines.rename(columns={
+            "order_time": "Order Time",
+            "coffee": "Coffee",
+            "quantity": "Quantity",
+            "price": "Price (RM)",
+            "customer": "Customer",
+        })[["Order Time", "Coffee", "Quantity", "Price (RM)", "Customer"]]
 
         # Latest Orders
         container = st.container(border=True)
@@ -68,29 +61,38 @@ def analytics_dashboard():
             st.write("Latest 10 Order Items:")
             st.table(latest_orders)
 
+        # Headline numbers come from a server-side aggregation; breakdowns from the daily rollup
+        today = datetime.datetime.now().date()
+        today_totals = order_totals(selected_branch_id, *day_bounds(today))
+        rollup = get_rollup(selected_branch_id, today) or {}
+        customer_sales = pd.Series(
+            {name: totals["revenue"] for name, totals in rollup.get("customers", {}).items()},
+            dtype=float,
+        )
+
         # Sales Stats
         container = st.container(border=True)
         with container:
             st.subheader("Sales Stats (Today)")
-            today = datetime.datetime.now().date()
-            df_today = df_orders[df_orders["Order Time"].dt.date == today]
-            total_sales = df_today["Price (RM)"].sum()
-            avg_order_value = df_today.groupby("Customer")["Price (RM)"].sum().mean() if not df_today.empty else 0
-            total_orders = df_today["Customer"].nunique()
+            total_sales = today_totals["revenue"]
+            avg_order_value = today_totals["avg_order_value"]
+            total_orders = today_totals["order_count"]
 
             st.metric("Total Sales", f"RM {total_sales:.2f}")
             st.metric("Average Order Value", f"RM {avg_order_value:.2f}")
             st.metric("Total Orders", total_orders)
 
         # Generate Sales Charts
-        if not df_today.empty:
+        if rollup:
             st.subheader("Sales Charts (Today)")
 
             # Hourly Sales Over Time
             container = st.container(border=True)
             with container:
-                df_today['Hour'] = df_today["Order Time"].dt.hour
-                hourly_sales = df_today.groupby('Hour')["Price (RM)"].sum().reset_index()
+                hourly_sales = pd.DataFrame(
+                    [{"Hour": int(hour), "Price (RM)": totals["revenue"]}
+                     for hour, totals in rollup.get("hours", {}).items()]
+                ).sort_values("Hour").reset_index(drop=True)
                 hourly_sales["Hour"] = hourly_sales["Hour"].apply(lambda x: f"{x}:00")
 
                 # Create a copy for display formatting
@@ -117,7 +119,10 @@ def analytics_dashboard():
             # Coffee-wise Sales Distribution
             container = st.container(border=True)
             with container:
-                coffee_sales = df_today.groupby("Coffee")["Price (RM)"].sum().reset_index()
+                coffee_sales = pd.DataFrame(
+                    [{"Coffee": coffee, "Price (RM)": totals["revenue"]}
+                     for coffee, totals in rollup.get("coffees", {}).items()]
+                )
                 coffee_sales = coffee_sales.sort_values("Price (RM)", ascending=True)
 
                 # Create a copy for display formatting
@@ -147,7 +152,7 @@ def analytics_dashboard():
             container = st.container(border=True)
             with container:
                 st.subheader("Top Customers (Today)")
-                top_customers = df_today.groupby("Customer")["Price (RM)"].sum().reset_index()
+                top_customers = customer_sales.rename("Price (RM)").rename_axis("Customer").reset_index()
                 top_customers = top_customers.sort_values("Price (RM)", ascending=False).head(5)
                 # Format the Price (RM) column to two decimal places
                 top_customers["Price (RM)"] = top_customers["Price (RM)"].map('{:.2f}'.format)
@@ -161,10 +166,7 @@ def analytics_dashboard():
             container = st.container(border=True)
             with container:
                 st.subheader("Profit Analysis (Today)")
-                df_today["Cost"] = df_today.apply(
-                    lambda row: menu[row["Coffee"]]["cost"] * row["Quantity"], axis=1)
-                df_today["Profit"] = df_today["Price (RM)"] - df_today["Cost"]
-                total_profit = df_today["Profit"].sum()
+                total_profit = today_totals["profit"]
                 profit_margin = (total_profit / total_sales) * 100 if total_sales else 0
                 st.metric("Total Profit", f"RM {total_profit:.2f}")
                 st.metric("Profit Margin", f"{profit_margin:.2f}%")
@@ -179,21 +181,15 @@ def analytics_dashboard():
         st.subheader(f"Inventory Health Check for {selected_branch_name}")
 
         # Fetch Inventory for the Selected Branch
-        branch_ref = db.collection("branches").document(selected_branch_id).get()
-        branch_inventory = branch_ref.to_dict()["inventory"] if branch_ref.exists else {}
-        low_stock_threshold = {
-            "coffee_beans": 100,
-            "cup": 50,
-            "milk": 20,
-            "sugar": 10
-        }
+        branch_inventory = get_branch_inventory(selected_branch_id) or {}
+        thresholds = low_stock_thresholds(directory.get(selected_branch_id))
 
         # Inventory Health Check section
         inventory_items = [
             {
                 "Item": item_key.replace('_', ' ').title(),
                 "Stock": stock,
-                "Threshold": low_stock_threshold.get(item_key, 50)
+                "Threshold": threshold_for(thresholds, item_key)
             }
             for item_key, stock in branch_inventory.items()
         ]
@@ -0,0 +1,205 @@
+# benchmarks/run_benchmarks.py
+"""Time every page against synthetic data and compare the results with a baseline.
+
+Runs entirely offline: the in-memory Firestore stand-in holds the generated
+data and ``local_stripe`` answers the checkout's Stripe calls. For each
+scenario it records the cold (first) render, the median of the warm
+re-renders, the Firestore documents read and written, and the peak memory
+allocated during a render.
+
+    python benchmarks/run_benchmarks.py --scale small
+    python benchmarks/run_benchmarks.py --scale small --save-baseline
+    python benchmarks/run_benchmarks.py --scale small --check
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must be set before firebase_init and utils are imported
+os.environ["COFFEE_APP_BACKEND"] = "memory"
+os.environ.setdefault("BROWSER", "true")  # The checkout's webbrowser.open becomes a no-op
+os.environ.setdefault("COFFEE_APP_TRACE_FILE", "")  # No per-rerun Firestore trace file
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines.json")
+STRIPE_PORT = 12112
+
+# A warm median or read count may exceed its baseline by this fraction before --check fails
+DEFAULT_TOLERANCE = 0.5
+
+ADMIN = "admin"
+CUSTOMER = "customer"
+
+# Scenario name -> (role, module, function)
+PAGES = {
+    "inventory": (ADMIN, "inventory", "inventory_management"),
+    "sales_reporting": (ADMIN, "sales_reporting", "sales_reporting"),
+    "analytics": (ADMIN, "analytics", "analytics_dashboard"),
+    "promotions": (ADMIN, "promotions", "promotions_management"),
+    "notification": (ADMIN, "notification", "notification_management"),
+    "order": (CUSTOMER, "order", "customer_order"),
+    "order_history": (CUSTOMER, "order_history", "order_history"),
+    "pickup_notification": (CUSTOMER, "pickup_notification", "pickup_notification"),
+    "feedback": (CUSTOMER, "feedback", "feedback"),
+}
+
+
+def _page_script(module, function):
+    return f"from {module} import {function}\n{function}()\n"
+
+
+def _app(role, module, function, cart=None):
+    from streamlit.testing.v1 import AppTest
+    from benchmarks.synthetic_data import customer_name
+
+    app = AppTest.from_string(_page_script(module, function), default_timeout=120)
+    # The heaviest synthetic customer, so customer pages see a long history
+    app.session_state["authenticated_user"] = "admin" if role == ADMIN else customer_name(0)
+    app.session_state["role"] = role
+    if cart:
+        app.session_state["cart"] = cart
+    return app
+
+
+def _render(role, module, function):
+    app = _app(role, module, function)
+    app.run()
+    return app
+
+
+def _checkout(role, module, function):
+    from benchmarks.synthetic_data import branch_id
+    from order_outbox import get_order_outbox
+
+    app = _app(role, module, function, cart=[{"coffee": "Americano", "quantity": 1, "branch_id": branch_id(0)}])
+    app.run()
+    next(button for button in app.button if button.label == "Checkout").click().run()
+    # Commit whatever the background flusher has not yet, so the writes are counted in this run every time
+    get_order_outbox().flush()
+    return app
+
+
+SCENARIOS = {name: (_render, page) for name, page in PAGES.items()}
+SCENARIOS["checkout"] = (_checkout, PAGES["order"])
+
+
+def _measure(db, action, page):
+    # Returns (seconds, reads, writes) for one run; raises if the page errored
+    before = db.usage()
+    started = time.perf_counter()
+    app = action(*page)
+    seconds = time.perf_counter() - started
+    after = db.usage()
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return seconds, after["reads"] - before["reads"], after["writes"] - before["writes"]
+
+
+def run_scenario(db, name, warm_runs):
+    action, page = SCENARIOS[name]
+    cold_seconds, cold_reads, cold_writes = _measure(db, action, page)
+    warm = [_measure(db, action, page) for _ in range(warm_runs)]
+
+    # Traced separately: tracemalloc slows every allocation down
+    tracemalloc.start()
+    try:
+        action(*page)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "cold_seconds": round(cold_seconds, 4),
+        "warm_median_seconds": round(statistics.median(run[0] for run in warm), 4),
+        "cold_reads": cold_reads,
+        "cold_writes": cold_writes,
+        "warm_reads": max(run[1] for run in warm),
+        "warm_writes": max(run[2] for run in warm),
+        "peak_memory_kib": peak // 1024,
+    }
+
+
+def run(scale, warm_runs, scenarios):
+    """Generate a dataset at ``scale`` and return ``{scenario: metrics}``."""
+    import local_stripe
+
+    local_stripe.serve(STRIPE_PORT)
+    os.environ["COFFEE_APP_STRIPE_API_BASE"] = f"http://127.0.0.1:{STRIPE_PORT}"
+
+    from firebase_init import db
+    from benchmarks.synthetic_data import SCALES, generate
+
+    generate(db, SCALES[scale])
+    return {name: run_scenario(db, name, warm_runs) for name in scenarios}
+
+
+def check(results, baseline, tolerance):
+    """Return a message per metric that regressed beyond ``tolerance``."""
+    regressions = []
+    for name, metrics in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        for metric in ("warm_median_seconds", "warm_reads", "cold_reads"):
+            limit = expected[metric] * (1 + tolerance)
+            if metrics[metric] > limit and metrics[metric] - expected[metric] > 0.001:
+                regressions.append(f"{name}.{metric}: {metrics[metric]} > {expected[metric]} (+{tolerance:.0%})")
+    return regressions
+
+
+def print_table(results):
+    columns = ["cold_seconds", "warm_median_seconds", "cold_reads", "cold_writes", "warm_reads", "warm_writes", "peak_memory_kib"]
+    width = max(len(name) for name in results)
+    print(f"{'scenario':<{width}}  " + "  ".join(f"{column:>19}" for column in columns))
+    for name, metrics in results.items():
+        print(f"{name:<{width}}  " + "  ".join(f"{metrics[column]:>19}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="small", choices=["small", "medium", "large"])
+    parser.add_argument("--warm-runs", type=int, default=5)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="Run only these scenarios")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Store the results in {os.path.relpath(BASELINE_PATH, ROOT)}")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if a metric regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    results = run(args.scale, args.warm_runs, args.scenario or list(SCENARIOS))
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"scale": args.scale, "results": results}, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[args.scale] = {**baselines.get(args.scale, {}), **results}
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved {args.scale} baseline to {BASELINE_PATH}")
+
+    if args.check:
+        if args.scale not in baselines:
+            sys.exit(f"No {args.scale} baseline in {BASELINE_PATH}; run with --save-baseline first.")
+        regressions = check(results, baselines[args.scale], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
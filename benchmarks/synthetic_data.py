@@ -0,0 +1,133 @@
+# benchmarks/synthetic_data.py
+"""Deterministic synthetic data for benchmarking the app against realistic volume."""
+import datetime
+import itertools
+import random
+from dataclasses import dataclass
+
+from firebase_init import commit_in_batches
+from menu import menu
+from order_service import cart_totals, order_line
+from sales_rollups import rebuild_rollups
+
+
+@dataclass
+class DatasetConfig:
+    branches: int = 5
+    customers: int = 200
+    orders_per_day: int = 100
+    days: int = 30
+    promotions: int = 10
+    feedback: int = 300
+    seed: int = 42
+
+
+# Named sizes for the benchmark runner
+SCALES = {
+    "small": DatasetConfig(branches=3, customers=50, orders_per_day=40, days=14, promotions=5, feedback=100),
+    "medium": DatasetConfig(),
+    "large": DatasetConfig(branches=20, customers=2000, orders_per_day=1000, days=90, promotions=40, feedback=5000),
+}
+
+
+def branch_id(index):
+    return f"branch_{index:03d}"
+
+
+def customer_name(index):
+    return f"customer_{index:05d}"
+
+
+def generate(db, config=DatasetConfig(), today=None):
+    """Fill ``db`` with branches, orders, rollups, promotions and feedback.
+
+    The same ``config`` (including ``seed``) always produces the same data.
+    A few customers place most orders, so per-customer pages see both light
+    and heavy histories; ``customer_name(0)`` is the heaviest. Returns a
+    summary of what was written.
+    """
+    today = today or datetime.date.today()
+    order_ids = []
+    written = commit_in_batches(_documents(db, config, today, order_ids), db)
+    rollups = rebuild_rollups()
+    return {
+        "branches": config.branches,
+        "orders": len(order_ids),
+        "promotions": config.promotions,
+        "feedback": min(config.feedback, len(order_ids)),
+        "rollups": rollups,
+        "documents_written": written + rollups,
+    }
+
+
+def _documents(db, config, today, order_ids):
+    # Yields ("set", reference, data) for every generated document; fills order_ids as it goes
+    rng = random.Random(config.seed)
+    tz = datetime.datetime.now().astimezone().tzinfo
+    coffees = list(menu)
+
+    for index in range(config.branches):
+        yield ("set", db.collection("branches").document(branch_id(index)), {
+            "cafe_name": f"Branch {index + 1}",
+            "inventory": {
+                "coffee_beans": rng.randint(50, 5000),
+                "milk": rng.randint(10, 3000),
+                "cup": rng.randint(50, 5000),
+                "sugar": rng.randint(5, 1000),
+            },
+        })
+
+    # Zipf-like weights: customer 0 orders most often
+    customer_weights = list(itertools.accumulate(1 / (index + 1) for index in range(config.customers)))
+    for day_offset in range(config.days):
+        day = today - datetime.timedelta(days=config.days - 1 - day_offset)
+        for _ in range(config.orders_per_day):
+            customer = rng.choices(range(config.customers), cum_weights=customer_weights)[0]
+            branch = branch_id(rng.randrange(config.branches))
+            cart = [
+                {"coffee": coffee, "quantity": rng.randint(1, 3)}
+                for coffee in rng.sample(coffees, rng.randint(1, 3))
+            ]
+            discounts = {cart[0]["coffee"]: 10} if rng.random() < 0.2 else {}
+            totals = cart_totals(cart, discounts)
+            order_time = datetime.datetime.combine(
+                day, datetime.time(rng.randint(7, 21), rng.randint(0, 59), rng.randint(0, 59)), tz
+            )
+            prepared = day < today or rng.random() < 0.7
+            order_ref = db.collection("orders").document()
+            yield ("set", order_ref, {
+                "customer": customer_name(customer),
+                "branch_id": branch,
+                "items": [{**order_line(item, discounts), "branch_id": branch} for item in cart],
+                "total_quantity": totals["total_quantity"],
+                "total_price": totals["total_price"],
+                "total_cost": totals["total_cost"],
+                "order_time": order_time,
+                "prepared_time": order_time + datetime.timedelta(minutes=rng.randint(2, 15)) if prepared else None,
+                "payment_status": rng.choice(["paid", "paid", "paid", "unpaid"]),
+            })
+            order_ids.append((order_ref.id, customer_name(customer), branch, cart))
+
+    for index in range(config.promotions):
+        is_coupon = index % 2 == 1
+        yield ("set", db.collection("promotions").document(), {
+            "type": "Coupon" if is_coupon else "Promotion",
+            "name": "" if is_coupon else f"Promotion {index}",
+            "coupon_code": f"CODE{index:03d}" if is_coupon else "",
+            "included_coffees": rng.sample(coffees, rng.randint(1, len(coffees))),
+            "discount": rng.choice([5, 10, 15, 20]),
+            "expiration_date": (today + datetime.timedelta(days=rng.randint(-10, 60))).isoformat(),
+        })
+
+    for _ in range(min(config.feedback, len(order_ids))):
+        order_id, customer, branch, cart = rng.choice(order_ids)
+        yield ("set", db.collection("feedbacks").document(), {
+            "order_id": order_id,
+            "coffee": rng.choice(cart)["coffee"],
+            "customer": customer,
+            "branch_id": branch,
+            "coffee_rating": rng.randint(1, 5),
+            "service_rating": rng.randint(1, 5),
+            "review": "",
+            "submitted_at": today.strftime("%Y-%m-%d 12:00:00"),
+        })
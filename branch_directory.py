@@ -0,0 +1,117 @@
+# branch_directory.py
+import threading
+import time
+
+from firebase_init import db
+from listener_cache import ListenerCache
+
+# Reload interval (seconds) used when the snapshot listener is unavailable
+BRANCH_DIRECTORY_TTL = 300
+
+_directory_lock = threading.Lock()
+_directory = None
+
+
+class BranchDirectory(ListenerCache):
+    """Process-wide index of the ``branches`` collection.
+
+    The directory is loaded once and kept fresh by an ``on_snapshot`` listener,
+    so pages resolve branch names and IDs without touching Firestore. If the
+    listener is unavailable, the directory reloads itself after a TTL.
+    """
+
+    def __init__(self, ttl=BRANCH_DIRECTORY_TTL):
+        self._by_id = {}
+        self._by_name = {}
+        self._missing = {}  # branch_id -> when a direct read found no such branch
+        super().__init__(ttl)
+
+    def _query(self):
+        return db.collection("branches")
+
+    def _rebuild(self, docs):
+        by_id = {}
+        by_name = {}
+        for doc in docs:
+            branch = {"id": doc.id, **doc.to_dict()}
+            by_id[doc.id] = branch
+            # Keep the first branch for duplicate names, like the old next(...) scan did
+            by_name.setdefault(branch.get("cafe_name"), doc.id)
+        with self._lock:
+            self._by_id = by_id
+            self._by_name = by_name
+            self._missing = {}
+
+    def branches(self):
+        """Return all branch documents (``{"id": ..., **fields}``) in collection order."""
+        self._ensure_fresh()
+        with self._lock:
+            return list(self._by_id.values())
+
+    def names(self):
+        """Return the branch names in collection order."""
+        return [branch["cafe_name"] for branch in self.branches()]
+
+    def id_for(self, branch_name):
+        """Return the branch ID for a branch name, or ``None``."""
+        self._ensure_fresh()
+        with self._lock:
+            return self._by_name.get(branch_name)
+
+    def get(self, branch_id):
+        """Return the cached branch document for an ID, or ``None``."""
+        self._ensure_fresh()
+        with self._lock:
+            return self._by_id.get(branch_id)
+
+    def _fetch_unknown(self, branch_ids):
+        # Read branches the directory has not seen yet (e.g. before the listener catches up) in one call
+        now = time.monotonic()
+        with self._lock:
+            unknown = [
+                branch_id for branch_id in branch_ids
+                if branch_id not in self._by_id and now - self._missing.get(branch_id, -self._ttl) > self._ttl
+            ]
+        if not unknown:
+            return
+        branch_docs = db.get_all([db.collection("branches").document(branch_id) for branch_id in unknown])
+        with self._lock:
+            for branch_doc in branch_docs:
+                if branch_doc.exists:
+                    self._by_id[branch_doc.id] = {"id": branch_doc.id, **branch_doc.to_dict()}
+                else:
+                    self._missing[branch_doc.id] = now
+
+    def names_for(self, branch_ids, default="Unknown Branch"):
+        """Return ``{branch_id: cafe_name}`` for many branch IDs.
+
+        IDs the directory does not know are read with a single ``get_all`` and
+        shared with every session; IDs found missing are not re-read until the
+        directory TTL passes.
+        """
+        branch_ids = set(branch_ids)
+        self._ensure_fresh()
+        self._fetch_unknown([branch_id for branch_id in branch_ids if branch_id and branch_id != "N/A"])
+
+        names = {}
+        with self._lock:
+            for branch_id in branch_ids:
+                if not branch_id or branch_id == "N/A":
+                    names[branch_id] = "N/A"
+                else:
+                    names[branch_id] = self._by_id.get(branch_id, {}).get("cafe_name", default)
+        return names
+
+    def name_for(self, branch_id, default="Unknown Branch"):
+        """Return the ``cafe_name`` for a branch ID."""
+        return self.names_for([branch_id], default)[branch_id]
+
+
+def get_branch_directory():
+    # One directory (and one listener) per server process, shared by all sessions and background threads.
+    # A plain singleton rather than st.cache_resource, which warns when called outside a script run
+    global _directory
+    with _directory_lock:
+        if _directory is None:
+            _directory = BranchDirectory()
+        return _directory
@@ -0,0 +1,394 @@
+# branch_inventory.py
+import random
+import threading
+import time
+
+from firebase_init import db, Increment, DELETE_FIELD, transactional
+from menu import menu
+from constants import DEFAULT_LOW_STOCK_THRESHOLD, LOW_STOCK_THRESHOLDS
+from branch_directory import get_branch_directory
+from recipe_matrix import INGREDIENTS, cart_is_feasible, required_vector
+
+# Subcollection under branches/{id} holding the inventory shard documents
+SHARD_COLLECTION = "inventory_shards"
+
+# Maximum number of shards an admin can configure for one branch
+MAX_INVENTORY_SHARDS = 20
+
+# Seconds a summed inventory stays cached before it is re-read
+INVENTORY_CACHE_TTL = 10
+
+_cache_lock = threading.Lock()
+_inventory_cache = {}  # branch_id -> (loaded_at, inventory, [(stock doc ref, its inventory, its update time)])
+_low_stock_flags = {}  # branch_id -> low-stock items last written by this process
+
+
+class InsufficientInventoryError(Exception):
+    """Raised when a branch cannot fulfil every item in a cart."""
+
+
+def required_ingredients(cart):
+    # Total quantity of each ingredient needed to make every item in the cart
+    return {ingredient: int(amount) for ingredient, amount in zip(INGREDIENTS, required_vector(cart)) if amount}
+
+
+def find_inventory_shortfall(cart, inventory):
+    # Return an error message for the first cart item the inventory cannot cover, or None
+    if cart_is_feasible(cart, inventory):
+        return None  # One vector comparison covers the common case
+
+    for item in cart:
+        coffee = item["coffee"]
+        quantity = item["quantity"]
+        requirements = menu[coffee]["requirements"]
+
+        # Check if inventory is sufficient for all requirements
+        for required_item, required_quantity in requirements.items():
+            if inventory.get(required_item, 0) < required_quantity * quantity:
+                return (
+                    f"Insufficient stock for {required_item} to fulfill {quantity}x {coffee}. "
+                    f"Available: {inventory.get(required_item, 0)}, Needed: {required_quantity * quantity}"
+                )
+
+    # Items are checked one by one above; make sure the cart as a whole also fits
+    for ingredient, needed in required_ingredients(cart).items():
+        if inventory.get(ingredient, 0) < needed:
+            return (
+                f"Insufficient stock for {ingredient} to fulfill this order. "
+                f"Available: {inventory.get(ingredient, 0)}, Needed: {needed}"
+            )
+    return None
+
+
+def low_stock_thresholds(branch_data=None):
+    """Return the low-stock threshold per ingredient: chain defaults plus the branch's overrides."""
+    thresholds = dict(LOW_STOCK_THRESHOLDS)
+    thresholds.update((branch_data or {}).get("low_stock_thresholds") or {})
+    return thresholds
+
+
+def threshold_for(thresholds, ingredient):
+    return thresholds.get(ingredient, DEFAULT_LOW_STOCK_THRESHOLD)
+
+
+def find_low_stock(inventory, thresholds):
+    """Return the ingredients whose stock is below their threshold, sorted."""
+    return sorted(ingredient for ingredient, stock in inventory.items() if stock < threshold_for(thresholds, ingredient))
+
+
+def shard_count(branch_data):
+    # Branches without an "inventory_shards" field keep stock in their "inventory" map
+    return int(branch_data.get("inventory_shards") or 0)
+
+
+def _shard_refs(branch_ref, num_shards):
+    shards = branch_ref.collection(SHARD_COLLECTION)
+    return [shards.document(str(index)) for index in range(num_shards)]
+
+
+def _sum_shards(shard_docs):
+    inventory = {}
+    for shard_doc in shard_docs:
+        for ingredient, stock in ((shard_doc.to_dict() or {}).get("inventory") or {}).items():
+            inventory[ingredient] = inventory.get(ingredient, 0) + stock
+    return inventory
+
+
+def _read_inventory(branch_ref, branch_data, transaction=None):
+    # Return (summed inventory, shard snapshots) for either representation
+    num_shards = shard_count(branch_data)
+    if not num_shards:
+        return dict(branch_data.get("inventory", {})), []
+    shard_docs = list(db.get_all(_shard_refs(branch_ref, num_shards), transaction=transaction))
+    return _sum_shards(shard_docs), shard_docs
+
+
+def invalidate_inventory_cache(branch_id=None):
+    with _cache_lock:
+        if branch_id is None:
+            _inventory_cache.clear()
+        else:
+            _inventory_cache.pop(branch_id, None)
+
+
+def _cached_inventory(branch_id, max_age):
+    # Return (inventory, stock docs) from the cache or a fresh read, or None if the branch is missing
+    with _cache_lock:
+        cached = _inventory_cache.get(branch_id)
+    if cached and time.monotonic() - cached[0] < max_age:
+        return cached[1], cached[2]
+
+    branch_ref = db.collection("branches").document(branch_id)
+    branch_doc = branch_ref.get()
+    if not branch_doc.exists:
+        return None
+    inventory, shard_docs = _read_inventory(branch_ref, branch_doc.to_dict())
+    if shard_docs:
+        stock_docs = [
+            (shard_doc.reference, (shard_doc.to_dict() or {}).get("inventory") or {}, shard_doc.update_time)
+            for shard_doc in shard_docs
+        ]
+    else:
+        stock_docs = [(branch_ref, inventory, branch_doc.update_time)]
+
+    with _cache_lock:
+        _inventory_cache[branch_id] = (time.monotonic(), inventory, stock_docs)
+    return inventory, stock_docs
+
+
+def get_branch_inventory(branch_id, max_age=INVENTORY_CACHE_TTL):
+    """Return the branch's total stock per ingredient, or ``None`` if the branch is missing.
+
+    Sharded inventories are summed across shards. Results are cached per
+    process for ``max_age`` seconds; pass ``max_age=0`` to force a fresh read.
+    """
+    cached = _cached_inventory(branch_id, max_age)
+    return dict(cached[0]) if cached is not None else None
+
+
+def last_known_inventory(branch_id):
+    """Like ``get_branch_inventory``, but falls back to the last stock seen while Firestore is unreachable.
+
+    Re-raises the read error if this process has not seen the branch's stock yet.
+    """
+    try:
+        return get_branch_inventory(branch_id)
+    except Exception:
+        with _cache_lock:
+            cached = _inventory_cache.get(branch_id)
+        if cached is None:
+            raise
+        return dict(cached[1])
+
+
+def plan_inventory_deduction(branch_id, cart):
+    """Pick a cached stock document that can cover ``cart`` on its own.
+
+    Uses the cached inventory, so this usually costs no reads. Returns a
+    plan for ``stage_inventory_deduction``, or ``None`` when the caller
+    should use ``deduct_inventory`` in a transaction: when no single
+    document covers the cart, or when the cached stock looks short or the
+    branch missing. The cache may be stale, so only the transaction decides
+    that an order cannot be fulfilled.
+    """
+    cached = _cached_inventory(branch_id, INVENTORY_CACHE_TTL)
+    if cached is None:
+        return None
+    inventory, stock_docs = cached
+    if find_inventory_shortfall(cart, inventory):
+        return None
+
+    needed = required_ingredients(cart)
+    # Any shard that covers the cart will do, so concurrent checkouts land on different documents
+    candidates = [
+        (reference, update_time) for reference, doc_inventory, update_time in stock_docs
+        if update_time is not None and all(doc_inventory.get(ingredient, 0) >= amount for ingredient, amount in needed.items())
+    ]
+    if not candidates:
+        return None
+    reference, update_time = random.choice(candidates)
+    return reference, needed, update_time
+
+
+def stage_inventory_deduction(batch, plan):
+    """Queue a planned deduction on ``batch`` as decrements of one stock document.
+
+    The decrements only apply if the document is unchanged since it was
+    cached (a ``last_update_time`` precondition), so a stale cache in this
+    or any other process makes the commit fail rather than oversell; the
+    caller should then retry with ``deduct_inventory`` in a transaction.
+    """
+    reference, needed, update_time = plan
+    if needed:
+        batch.update(
+            reference,
+            {f"inventory.{ingredient}": Increment(-amount) for ingredient, amount in needed.items()},
+            option=db.write_option(last_update_time=update_time),
+        )
+
+
+def note_inventory_deducted(branch_id, plan, update_time):
+    # Keep this process's cached stock, and the deducted document's update time, in step with a committed deduction
+    reference, needed, last_update_time = plan
+    with _cache_lock:
+        cached = _inventory_cache.get(branch_id)
+        if not cached:
+            return
+        loaded_at, inventory, stock_docs = cached
+        if not any(doc_ref.path == reference.path and doc_time == last_update_time for doc_ref, _, doc_time in stock_docs):
+            return  # Re-read since the plan was made; the cache already reflects the deduction
+        inventory = {ingredient: stock - needed.get(ingredient, 0) for ingredient, stock in inventory.items()}
+        stock_docs = [
+            (doc_ref, {ingredient: stock - needed.get(ingredient, 0) for ingredient, stock in doc_inventory.items()}, update_time)
+            if doc_ref.path == reference.path else (doc_ref, doc_inventory, doc_time)
+            for doc_ref, doc_inventory, doc_time in stock_docs
+        ]
+        _inventory_cache[branch_id] = (loaded_at, inventory, stock_docs)
+
+
+def deduct_inventory(transaction, branch_ref, branch_data, cart):
+    """Deduct the cart's ingredients from the branch inside ``transaction``.
+
+    Sharded branches first try a single random shard so concurrent checkouts
+    land on different documents; only when that shard cannot cover the cart
+    are the remaining shards read and the deduction spread across them.
+    Raises ``InsufficientInventoryError`` if the branch is short.
+    """
+    needed = required_ingredients(cart)
+    num_shards = shard_count(branch_data)
+
+    if not num_shards:
+        inventory = branch_data.get("inventory", {})
+        shortfall = find_inventory_shortfall(cart, inventory)
+        if shortfall:
+            raise InsufficientInventoryError(shortfall)
+        if needed:
+            transaction.update(branch_ref, {
+                f"inventory.{ingredient}": inventory[ingredient] - amount
+                for ingredient, amount in needed.items()
+            })
+        return
+
+    shard_refs = _shard_refs(branch_ref, num_shards)
+    first_ref = shard_refs.pop(random.randrange(num_shards))
+    first_doc = first_ref.get(transaction=transaction)
+    first_inventory = (first_doc.to_dict() or {}).get("inventory") or {}
+    if all(first_inventory.get(ingredient, 0) >= amount for ingredient, amount in needed.items()):
+        if needed:
+            transaction.update(first_ref, {
+                f"inventory.{ingredient}": first_inventory[ingredient] - amount
+                for ingredient, amount in needed.items()
+            })
+        return
+
+    other_docs = list(db.get_all(shard_refs, transaction=transaction)) if shard_refs else []
+    shard_docs = [first_doc] + other_docs
+    shortfall = find_inventory_shortfall(cart, _sum_shards(shard_docs))
+    if shortfall:
+        raise InsufficientInventoryError(shortfall)
+
+    updates = {}
+    for ingredient, amount in needed.items():
+        remaining = amount
+        for shard_doc in shard_docs:
+            if remaining <= 0:
+                break
+            shard_inventory = (shard_doc.to_dict() or {}).get("inventory") or {}
+            taken = min(shard_inventory.get(ingredient, 0), remaining)
+            if taken > 0:
+                updates.setdefault(shard_doc.id, (shard_doc.reference, {}))[1][f"inventory.{ingredient}"] = (
+                    shard_inventory[ingredient] - taken
+                )
+                remaining -= taken
+    for shard_ref, shard_updates in updates.values():
+        transaction.update(shard_ref, shard_updates)
+
+
+def restock_inventory(branch_id, ingredient, quantity):
+    """Add stock for one ingredient, spread evenly across the branch's shards."""
+    branch_ref = db.collection("branches").document(branch_id)
+    branch_doc = branch_ref.get()
+    if not branch_doc.exists:
+        raise ValueError(f"Branch with ID '{branch_id}' not found.")
+    num_shards = shard_count(branch_doc.to_dict())
+
+    if not num_shards:
+        branch_ref.update({f"inventory.{ingredient}": Increment(quantity)})
+    else:
+        base, extra = divmod(quantity, num_shards)
+        extra_shards = set(random.sample(range(num_shards), extra))
+        batch = db.batch()
+        for index, shard_ref in enumerate(_shard_refs(branch_ref, num_shards)):
+            amount = base + (1 if index in extra_shards else 0)
+            if amount:
+                batch.set(shard_ref, {"inventory": {ingredient: Increment(amount)}}, merge=True)
+        batch.commit()
+    invalidate_inventory_cache(branch_id)
+    update_low_stock_flag(branch_id)
+
+
+def update_low_stock_flag(branch_id, inventory=None, thresholds=None):
+    """Keep the branch's ``low_stock`` and ``low_stock_items`` fields in step with its stock.
+
+    Writes only when the set of low items changes. The stored value comes
+    from the shared branch directory, which its listener keeps in step with
+    every process's writes, so the check itself usually costs no reads; what
+    this process last wrote is only used while the directory has no flag.
+    Returns ``True`` if the branch was updated.
+    """
+    branch = get_branch_directory().get(branch_id)
+    if branch is None:
+        return False
+    if inventory is None:
+        inventory = get_branch_inventory(branch_id) or {}
+    items = find_low_stock(inventory, thresholds or low_stock_thresholds(branch))
+
+    if "low_stock" in branch:
+        known = branch.get("low_stock_items") or []
+    else:
+        with _cache_lock:
+            known = _low_stock_flags.get(branch_id)
+    if known == items:
+        return False
+    _write_low_stock_flag(branch_id, items)
+    return True
+
+
+def _write_low_stock_flag(branch_id, items):
+    db.collection("branches").document(branch_id).update({"low_stock": bool(items), "low_stock_items": items})
+    with _cache_lock:
+        _low_stock_flags[branch_id] = items
+        # The write moved the branch's update time, which batched deductions are conditioned on
+        _inventory_cache.pop(branch_id, None)
+
+
+def refresh_low_stock_flags():
+    """Recompute the low-stock flag of every branch; returns the number of branches updated.
+
+    Reads every branch and its stock afresh and writes wherever the stored
+    flag differs, so flags that drifted are repaired.
+    """
+    updated = 0
+    for branch_doc in db.collection("branches").stream():
+        branch = branch_doc.to_dict()
+        inventory, _ = _read_inventory(branch_doc.reference, branch)
+        items = find_low_stock(inventory, low_stock_thresholds(branch))
+        if "low_stock" not in branch or (branch.get("low_stock_items") or []) != items:
+            _write_low_stock_flag(branch_doc.id, items)
+            updated += 1
+    return updated
+
+
+def get_low_stock_branches():
+    """Return ``{"id", "cafe_name", "low_stock_items"}`` for every low branch with one indexed query."""
+    return [
+        {"id": branch_doc.id, "cafe_name": branch_doc.get("cafe_name"), "low_stock_items": branch_doc.get("low_stock_items")}
+        for branch_doc in db.collection("branches").where("low_stock", "==", True).stream()
+    ]
+
+
+@transactional
+def _reshard(transaction, branch_ref, num_shards):
+    branch_doc = branch_ref.get(transaction=transaction)
+    if not branch_doc.exists:
+        raise ValueError(f"Branch with ID '{branch_ref.id}' not found.")
+    branch_data = branch_doc.to_dict()
+    inventory, _ = _read_inventory(branch_ref, branch_data, transaction=transaction)
+    old_shards = shard_count(branch_data)
+
+    for index, shard_ref in enumerate(_shard_refs(branch_ref, num_shards)):
+        transaction.set(shard_ref, {"inventory": {
+            ingredient: total // num_shards + (1 if index < total % num_shards else 0)
+            for ingredient, total in inventory.items()
+        }})
+    for shard_ref in _shard_refs(branch_ref, old_shards)[num_shards:]:
+        transaction.delete(shard_ref)
+    transaction.update(branch_ref, {"inventory_shards": num_shards, "inventory": DELETE_FIELD})
+
+
+def configure_inventory_shards(branch_id, num_shards):
+    """Redistribute a branch's current stock across ``num_shards`` shard documents."""
+    if not 1 <= num_shards <= MAX_INVENTORY_SHARDS:
+        raise ValueError(f"Shard count must be between 1 and {MAX_INVENTORY_SHARDS}.")
+    _reshard(db.transaction(), db.collection("branches").document(branch_id), num_shards)
+    invalidate_inventory_cache(branch_id)
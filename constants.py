@@ -11,3 +11,14 @@ ITEM_DISPLAY_NAMES = {
 
 # Reverse mapping from display names to database keys
 DISPLAY_NAME_TO_ITEM = {v: k for k, v in ITEM_DISPLAY_NAMES.items()}
+
+# Chain-wide low-stock thresholds; a branch can override them in its "low_stock_thresholds" map
+LOW_STOCK_THRESHOLDS = {
+    'coffee_beans': 100,
+    'cup': 50,
+    'milk': 20,
+    'sugar': 10,
+}
+
+# Threshold for items without an entry above
+DEFAULT_LOW_STOCK_THRESHOLD = 50
@@ -0,0 +1,25 @@
+# datetime_json.py
+"""JSON encoding that round-trips ``datetime`` values, for documents stored as text."""
+import datetime
+import json
+
+
+class _JSONEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return {"__datetime__": o.isoformat()}
+        return super().default(o)
+
+
+def _decode_object(obj):
+    if "__datetime__" in obj and len(obj) == 1:
+        return datetime.datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def dumps(obj):
+    return json.dumps(obj, cls=_JSONEncoder)
+
+
+def loads(text):
+    return json.loads(text, object_hook=_decode_object)
@@ -2,6 +2,8 @@
 import streamlit as st
 from firebase_init import db
 import datetime
+from order_times import format_order_time
+from branch_directory import get_branch_directory
 
 def feedback():
     st.title("Feedback")
@@ -24,14 +26,7 @@ def feedback():
 
         # Fetch branch name using branch_id
         branch_id = selected_order.get('branch_id', 'N/A')
-        if branch_id != 'N/A':
-            branch_doc = db.collection('branches').document(branch_id).get()
-            if branch_doc.exists:
-                branch_name = branch_doc.to_dict().get('cafe_name', 'Unknown Branch')
-            else:
-                branch_name = 'Unknown Branch'
-        else:
-            branch_name = 'N/A'
+        branch_name = get_branch_directory().name_for(branch_id)
 
         # Display order details in a container with a border
         with st.container(border=True):
@@ -43,7 +38,7 @@ def feedback():
                 quantity = item['quantity']
                 st.write(f"{quantity}x {coffee_name}")
             st.write(f"**Branch:** {branch_name}")
-            st.write(f"**Order Placed At:** {selected_order['order_time']}")
+            st.write(f"**Order Placed At:** {format_order_time(selected_order['order_time'])}")
 
         # Allow customer to select an item from the order to provide feedback
         item_descriptions = [
@@ -1,15 +1,74 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import os
+
 import streamlit as st
-# Load Firebase credentials from Streamlit secrets
-firebase_creds = st.secrets["firebase"]
+from firestore_trace import TracedClient
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 500
+
+# Storage backend: "firestore" (default), "memory" or "sqlite"
+BACKEND = os.environ.get("COFFEE_APP_BACKEND", "firestore").lower()
+
+if BACKEND == "firestore":
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    # Load Firebase credentials from Streamlit secrets
+    firebase_creds = st.secrets["firebase"]
+
+    # Convert AttrDict to a plain dictionary
+    firebase_creds_dict = dict(firebase_creds)
+
+    # Initialize Firebase App
+    cred = credentials.Certificate(firebase_creds_dict)  # Pass the plain dictionary
+    firebase_admin.initialize_app(cred)
+
+    # Connect to Firestore Database
+    db = firestore.client()
+
+    # Field transforms and helpers, re-exported so callers work with either backend
+    Increment = firestore.Increment
+    SERVER_TIMESTAMP = firestore.SERVER_TIMESTAMP
+    DELETE_FIELD = firestore.DELETE_FIELD
+    Query = firestore.Query
+    transactional = firestore.transactional
+elif BACKEND in ("memory", "sqlite"):
+    import local_store
+
+    # Local stand-in for offline development, profiling and load tests
+    sqlite_path = os.environ.get("COFFEE_APP_SQLITE_PATH", "coffee_app.sqlite3") if BACKEND == "sqlite" else None
+    db = local_store.Client(path=sqlite_path)
+
+    Increment = local_store.Increment
+    SERVER_TIMESTAMP = local_store.SERVER_TIMESTAMP
+    DELETE_FIELD = local_store.DELETE_FIELD
+    Query = local_store.Query
+    transactional = local_store.transactional
+else:
+    raise ValueError(f"Unknown COFFEE_APP_BACKEND '{BACKEND}'. Use 'firestore', 'memory' or 'sqlite'.")
+
+# Count reads and writes and time queries per rerun, whichever backend is in use
+db = TracedClient(db)
 
-# Convert AttrDict to a plain dictionary
-firebase_creds_dict = dict(firebase_creds)
 
-# Initialize Firebase App
-cred = credentials.Certificate(firebase_creds_dict)  # Pass the plain dictionary
-firebase_admin.initialize_app(cred)
+def commit_in_batches(writes, client=None):
+    """Apply ``(method, reference, *args)`` writes in WriteBatches of up to 500.
 
-# Connect to Firestore Database
-db = firestore.client()
+    ``writes`` may be any iterable, e.g. ``("update", ref, fields)`` or
+    ``("delete", ref)``; it is consumed lazily. Returns the number of writes.
+    """
+    client = client or db
+    batch = client.batch()
+    pending = written = 0
+    for method, reference, *args in writes:
+        getattr(batch, method)(reference, *args)
+        pending += 1
+        if pending == BATCH_SIZE:
+            batch.commit()
+            written += pending
+            batch = client.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+        written += pending
+    return written
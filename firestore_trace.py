@@ -0,0 +1,475 @@
+# firestore_trace.py
+"""Per-rerun accounting of Firestore reads, writes and query latency.
+
+``firebase_init`` wraps the client in ``TracedClient``. Every document read,
+write and query made while a page renders is recorded against that rerun,
+tagged with the page and the line of app code that made the call. Finished
+reruns are appended to a JSONL trace file and the last few are kept in the
+session for the admin panel.
+"""
+import contextlib
+import datetime
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# JSONL file each finished rerun is appended to; set COFFEE_APP_TRACE_FILE="" to disable
+TRACE_FILE = os.environ.get("COFFEE_APP_TRACE_FILE", "firestore_trace.jsonl")
+
+# The trace file is rotated to <name>.1 once it grows past this size
+TRACE_FILE_MAX_BYTES = 50 * 1024 * 1024
+
+# Operations kept per rerun; totals still count everything beyond this
+MAX_OPS_PER_TRACE = 1000
+
+# Calls from one line in one rerun at which the panel flags a likely N+1
+N_PLUS_ONE_CALLS = 5
+
+# Reruns kept in the session for the panel
+RECENT_TRACES = 20
+
+_THIS_FILE = os.path.abspath(__file__)
+_local = threading.local()
+_file_lock = threading.Lock()
+
+
+def _call_site():
+    # The first frame outside this module is the app code that touched Firestore
+    frame = sys._getframe(2)
+    while frame is not None and os.path.abspath(frame.f_code.co_filename) == _THIS_FILE:
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} ({frame.f_code.co_name})"
+
+
+class RerunTrace:
+    """Reads, writes and timed operations recorded during one script or fragment run."""
+
+    def __init__(self, page, fragment=None):
+        self.page = page
+        self.fragment = fragment
+        self.started_at = datetime.datetime.now().astimezone()
+        self._started = time.perf_counter()
+        self.elapsed = None
+        self.reads = 0
+        self.writes = 0
+        self.firestore_seconds = 0.0
+        self.ops = []
+        self.dropped_ops = 0
+
+    def record(self, op, target, site, reads=0, writes=0, seconds=0.0, full_scan=False):
+        self.reads += reads
+        self.writes += writes
+        self.firestore_seconds += seconds
+        if len(self.ops) >= MAX_OPS_PER_TRACE:
+            self.dropped_ops += 1
+            return
+        entry = {"op": op, "target": target, "site": site, "reads": reads, "writes": writes, "ms": round(seconds * 1000, 2)}
+        if full_scan:
+            entry["full_scan"] = True
+        self.ops.append(entry)
+
+    def by_site(self):
+        """Return the operations grouped by call site, most reads first."""
+        sites = {}
+        for entry in self.ops:
+            site = sites.setdefault((entry["site"], entry["op"], entry["target"]), {
+                "Call Site": entry["site"], "Operation": entry["op"], "Target": entry["target"],
+                "Calls": 0, "Reads": 0, "Writes": 0, "Time (ms)": 0.0,
+            })
+            site["Calls"] += 1
+            site["Reads"] += entry["reads"]
+            site["Writes"] += entry["writes"]
+            site["Time (ms)"] = round(site["Time (ms)"] + entry["ms"], 2)
+        return sorted(sites.values(), key=lambda site: (-site["Reads"], -site["Writes"], -site["Calls"]))
+
+    def warnings(self):
+        """Return likely N+1 call sites and unfiltered collection scans."""
+        found = []
+        for site in self.by_site():
+            if site["Calls"] >= N_PLUS_ONE_CALLS and site["Operation"] != "batch.commit":
+                found.append(f"{site['Call Site']} ran {site['Operation']} on {site['Target']} {site['Calls']} times (possible N+1)")
+        scans = {(entry["site"], entry["target"]) for entry in self.ops if entry.get("full_scan")}
+        for site, target in sorted(scans):
+            found.append(f"{site} read all of {target} (no filter or limit)")
+        return found
+
+    def summary(self):
+        return {
+            "page": self.page,
+            "fragment": self.fragment,
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            "elapsed_ms": round((self.elapsed if self.elapsed is not None else time.perf_counter() - self._started) * 1000, 2),
+            "firestore_ms": round(self.firestore_seconds * 1000, 2),
+            "reads": self.reads,
+            "writes": self.writes,
+            "dropped_ops": self.dropped_ops,
+        }
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._started
+
+
+def current_trace():
+    """Return the trace of the rerun running on this thread, if any."""
+    return getattr(_local, "trace", None)
+
+
+def _record(*args, **kwargs):
+    trace = current_trace()
+    if trace is None:
+        if get_script_run_ctx(suppress_warning=True) is None:
+            return  # Background threads and listeners are not part of any rerun
+        # Widget callbacks run just before the script on the same thread; the next trace adopts them
+        trace = _local.pending = getattr(_local, "pending", None) or RerunTrace(None)
+    trace.record(*args, **kwargs)
+
+
+@contextlib.contextmanager
+def trace_rerun(page, fragment=None):
+    """Record Firestore usage for the enclosed script or fragment run.
+
+    Nested uses (a fragment rendered during a full rerun) join the outer trace.
+    """
+    if current_trace() is not None:
+        yield current_trace()
+        return
+    trace = RerunTrace(page, fragment)
+    pending = getattr(_local, "pending", None)
+    if pending is not None:
+        for entry in pending.ops:
+            trace.ops.append({**entry, "callback": True})
+        trace.reads, trace.writes, trace.firestore_seconds = pending.reads, pending.writes, pending.firestore_seconds
+        _local.pending = None
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        # Also reached when the page calls st.rerun() or st.stop()
+        _local.trace = None
+        trace.finish()
+        _store(trace)
+
+
+def trace_fragment(page):
+    """Decorator tracing a ``st.fragment`` that can rerun on its own."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace_rerun(page, fragment=func.__name__):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _store(trace):
+    summary = trace.summary()
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        recent = st.session_state.setdefault("firestore_traces", [])
+        recent.append(summary)
+        del recent[:-RECENT_TRACES]
+    if TRACE_FILE:
+        _append_to_file({**summary, "ops": trace.ops})
+
+
+def _append_to_file(record):
+    line = json.dumps(record, default=str) + "\n"
+    with _file_lock:
+        try:
+            if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) > TRACE_FILE_MAX_BYTES:
+                os.replace(TRACE_FILE, TRACE_FILE + ".1")
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError:
+            pass  # Tracing must never break a page
+
+
+def _unwrap(value):
+    return value._wrapped if isinstance(value, _Traced) else value
+
+
+class _Traced:
+    # Forwards everything it does not instrument to the wrapped Firestore object
+    def __init__(self, wrapped):
+        object.__setattr__(self, "_wrapped", wrapped)
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._wrapped, name, value)
+
+    def __eq__(self, other):
+        return self._wrapped == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._wrapped)
+
+    def __repr__(self):
+        return repr(self._wrapped)
+
+
+class TracedClient(_Traced):
+    """Firestore client that records reads, writes and latency against the current rerun."""
+
+    def collection(self, *path):
+        return _TracedQuery(self._wrapped.collection(*path), "/".join(path))
+
+    def batch(self):
+        return _TracedWriter(self._wrapped.batch(), "batch")
+
+    def transaction(self, **kwargs):
+        return _TracedWriter(self._wrapped.transaction(**kwargs), "transaction")
+
+    def get_all(self, references, *args, **kwargs):
+        references = [_unwrap(reference) for reference in references]
+        if "transaction" in kwargs:
+            kwargs["transaction"] = _unwrap(kwargs["transaction"])
+        collections = sorted({reference.parent.id for reference in references})
+        return _timed_stream(
+            self._wrapped.get_all(references, *args, **kwargs), "get_all", ",".join(collections), _call_site(),
+            min_reads=0,
+        )
+
+
+def _timed_stream(snapshots, op, target, site, min_reads=1, full_scan=False):
+    # Times only the work done inside the iterator, and records once it is exhausted or closed
+    count = 0
+    seconds = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                snapshot = next(snapshots)
+            except StopIteration:
+                seconds += time.perf_counter() - started
+                break
+            seconds += time.perf_counter() - started
+            count += 1
+            yield snapshot
+    finally:
+        # Firestore bills one read for a query that matches nothing
+        _record(op, target, site, reads=max(count, min_reads), seconds=seconds, full_scan=full_scan)
+
+
+class _TracedQuery(_Traced):
+    # A collection reference or a query built from one
+    def __init__(self, wrapped, path, filters=(), limited=False):
+        super().__init__(wrapped)
+        object.__setattr__(self, "_path", path)
+        object.__setattr__(self, "_filters", filters)
+        object.__setattr__(self, "_limited", limited)
+
+    def _derive(self, wrapped, filters=None, limited=None):
+        return _TracedQuery(
+            wrapped, self._path,
+            self._filters if filters is None else filters,
+            self._limited if limited is None else limited,
+        )
+
+    def _target(self):
+        # Field names and operators only; filter values may hold customer data
+        target = self._path
+        if self._filters:
+            target += "[" + ", ".join(self._filters) + "]"
+        return target + (" limit" if self._limited else "")
+
+    def where(self, field_path, op_string, value):
+        return self._derive(self._wrapped.where(field_path, op_string, value), filters=self._filters + (f"{field_path} {op_string}",))
+
+    def order_by(self, *args, **kwargs):
+        return self._derive(self._wrapped.order_by(*args, **kwargs))
+
+    def limit(self, count):
+        return self._derive(self._wrapped.limit(count), limited=True)
+
+    def start_after(self, *args, **kwargs):
+        return self._derive(self._wrapped.start_after(*args, **kwargs))
+
+    def document(self, *args):
+        reference = self._wrapped.document(*args)
+        return _TracedDocument(reference, f"{self._path}/{reference.id}")
+
+    def stream(self, transaction=None, **kwargs):
+        full_scan = not self._filters and not self._limited
+        return _timed_stream(
+            self._wrapped.stream(transaction=_unwrap(transaction), **kwargs), "query", self._target(), _call_site(),
+            full_scan=full_scan,
+        )
+
+    def get(self, transaction=None, **kwargs):
+        return list(self.stream(transaction=transaction, **kwargs))
+
+    def add(self, document_data, *args, **kwargs):
+        site = _call_site()
+        started = time.perf_counter()
+        result = self._wrapped.add(document_data, *args, **kwargs)
+        _record("add", self._path, site, writes=1, seconds=time.perf_counter() - started)
+        return result
+
+    def count(self, *args, **kwargs):
+        return _TracedAggregation(self._wrapped.count(*args, **kwargs), self._target())
+
+    def sum(self, *args, **kwargs):
+        return _TracedAggregation(self._wrapped.sum(*args, **kwargs), self._target())
+
+    def avg(self, *args, **kwargs):
+        return _TracedAggregation(self._wrapped.avg(*args, **kwargs), self._target())
+
+
+class _TracedAggregation(_Traced):
+    def __init__(self, wrapped, target):
+        super().__init__(wrapped)
+        object.__setattr__(self, "_target", target)
+
+    def _derive(self, wrapped):
+        return _TracedAggregation(wrapped, self._target)
+
+    def count(self, *args, **kwargs):
+        return self._derive(self._wrapped.count(*args, **kwargs))
+
+    def sum(self, *args, **kwargs):
+        return self._derive(self._wrapped.sum(*args, **kwargs))
+
+    def avg(self, *args, **kwargs):
+        return self._derive(self._wrapped.avg(*args, **kwargs))
+
+    def get(self, *args, **kwargs):
+        site = _call_site()
+        started = time.perf_counter()
+        result = self._wrapped.get(*args, **kwargs)
+        # Billed as one read per 1,000 index entries scanned; recorded as the minimum
+        _record("aggregation", self._target, site, reads=1, seconds=time.perf_counter() - started)
+        return result
+
+
+class _TracedDocument(_Traced):
+    def __init__(self, wrapped, path):
+        super().__init__(wrapped)
+        object.__setattr__(self, "_path", path)
+
+    def _collection_name(self):
+        return self._path.rsplit("/", 1)[0]
+
+    def _timed(self, op, reads, writes, call, *args, **kwargs):
+        site = _call_site()
+        started = time.perf_counter()
+        result = call(*args, **kwargs)
+        _record(op, self._collection_name(), site, reads=reads, writes=writes, seconds=time.perf_counter() - started)
+        return result
+
+    def collection(self, *path):
+        return _TracedQuery(self._wrapped.collection(*path), "/".join((self._path,) + path))
+
+    def get(self, *args, transaction=None, **kwargs):
+        return self._timed("get", 1, 0, self._wrapped.get, *args, transaction=_unwrap(transaction), **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self._timed("set", 0, 1, self._wrapped.set, *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._timed("update", 0, 1, self._wrapped.update, *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._timed("create", 0, 1, self._wrapped.create, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._timed("delete", 0, 1, self._wrapped.delete, *args, **kwargs)
+
+
+class _TracedWriter(_Traced):
+    # A WriteBatch or Transaction; writes are counted when committed (transactions: when staged)
+    def __init__(self, wrapped, kind):
+        super().__init__(wrapped)
+        object.__setattr__(self, "_kind", kind)
+        object.__setattr__(self, "_staged", {})
+
+    def _stage(self, reference):
+        collection = reference.parent.id
+        self._staged[collection] = self._staged.get(collection, 0) + 1
+        if self._kind == "transaction":
+            # The transactional decorator commits the real object directly
+            _record("transaction.write", collection, _call_site(), writes=1)
+
+    def create(self, reference, *args, **kwargs):
+        reference = _unwrap(reference)
+        self._stage(reference)
+        return self._wrapped.create(reference, *args, **kwargs)
+
+    def set(self, reference, *args, **kwargs):
+        reference = _unwrap(reference)
+        self._stage(reference)
+        return self._wrapped.set(reference, *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        reference = _unwrap(reference)
+        self._stage(reference)
+        return self._wrapped.update(reference, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        reference = _unwrap(reference)
+        self._stage(reference)
+        return self._wrapped.delete(reference, *args, **kwargs)
+
+    def get(self, reference_or_query, *args, **kwargs):
+        site = _call_site()
+        started = time.perf_counter()
+        result = list(self._wrapped.get(_unwrap(reference_or_query), *args, **kwargs))
+        _record("transaction.get", getattr(reference_or_query, "_path", "?"), site, reads=max(len(result), 1), seconds=time.perf_counter() - started)
+        return iter(result)
+
+    def commit(self, *args, **kwargs):
+        site = _call_site()
+        staged = dict(self._staged)
+        self._staged.clear()
+        started = time.perf_counter()
+        result = self._wrapped.commit(*args, **kwargs)
+        writes = sum(staged.values()) if self._kind == "batch" else 0
+        _record(f"{self._kind}.commit", ",".join(sorted(staged)), site, writes=writes, seconds=time.perf_counter() - started)
+        return result
+
+
+def firestore_usage_report():
+    """Show this session's Firestore reads, writes and slowest call sites per rerun."""
+    trace = current_trace()
+    recent = st.session_state.get("firestore_traces", [])
+    with st.sidebar.expander("Firestore Usage"):
+        if trace is not None:
+            summary = trace.summary()
+            st.caption(f"This run of **{summary['page']}**")
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Reads", summary["reads"])
+            col2.metric("Writes", summary["writes"])
+            col3.metric("Firestore ms", summary["firestore_ms"])
+            for warning in trace.warnings():
+                st.warning(warning)
+            sites = trace.by_site()
+            if sites:
+                st.dataframe(sites, hide_index=True)
+        if recent:
+            st.caption("Recent reruns")
+            st.dataframe(
+                [
+                    {
+                        "Page": item["page"] + (f" ({item['fragment']})" if item["fragment"] else ""),
+                        "Reads": item["reads"],
+                        "Writes": item["writes"],
+                        "Firestore (ms)": item["firestore_ms"],
+                        "Total (ms)": item["elapsed_ms"],
+                    }
+                    for item in reversed(recent)
+                ],
+                hide_index=True,
+            )
+        if TRACE_FILE:
+            st.caption(f"Full traces are appended to `{TRACE_FILE}`.")
@@ -1,9 +1,23 @@
 # inventory.py
 
 import streamlit as st
-from firebase_init import db
 import pandas as pd
-from constants import ITEM_DISPLAY_NAMES, DISPLAY_NAME_TO_ITEM  # Import mappings from constants.py
+from branch_directory import get_branch_directory
+from firebase_init import db
+from branch_inventory import (
+    MAX_INVENTORY_SHARDS,
+    configure_inventory_shards,
+    find_low_stock,
+    get_branch_inventory,
+    get_low_stock_branches,
+    low_stock_thresholds,
+    refresh_low_stock_flags,
+    restock_inventory,
+    shard_count,
+    threshold_for,
+    update_low_stock_flag,
+)
+from constants import ITEM_DISPLAY_NAMES, DISPLAY_NAME_TO_ITEM, LOW_STOCK_THRESHOLDS  # Import mappings from constants.py
 
 def inventory_management():
     st.title("Inventory Management")
@@ -12,38 +26,58 @@ def inventory_management():
     if "restock_message" not in st.session_state:
         st.session_state["restock_message"] = None
 
-    # Fetch the list of branches
-    branches_ref = db.collection("branches").stream()
-    branches = [{"id": branch.id, **branch.to_dict()} for branch in branches_ref]
+    # Fetch the list of branches from the shared branch directory
+    directory = get_branch_directory()
+    branch_names = directory.names()
+
+    if branch_names:
+        # Chain-wide low-stock overview from one indexed query on the branches' low_stock flag
+        with st.container(border=True):
+            st.subheader("Low Stock Across Branches")
+            low_branches = get_low_stock_branches()
+            if low_branches:
+                st.table(pd.DataFrame([
+                    {
+                        "Branch": branch["cafe_name"],
+                        "Low Items": ", ".join(
+                            ITEM_DISPLAY_NAMES.get(item_key, item_key.replace('_', ' ').title())
+                            for item_key in branch["low_stock_items"] or []
+                        ),
+                    }
+                    for branch in low_branches
+                ]))
+            else:
+                st.success("No branch is low on stock.")
+            if st.button("Recompute Low-Stock Flags"):
+                updated = refresh_low_stock_flags()
+                st.session_state["restock_message"] = f"Low-stock flags recomputed; {updated} branch(es) changed."
+                st.rerun()
 
-    if branches:
         # Wrap branch selection in a container
         with st.container(border=True):
             # Select a branch
             st.subheader("Select a Branch")
-            branch_names = [branch["cafe_name"] for branch in branches]
             selected_branch_name = st.selectbox("Select Branch", branch_names)
-            selected_branch = next(branch for branch in branches if branch["cafe_name"] == selected_branch_name)
+            selected_branch_id = directory.id_for(selected_branch_name)
+            selected_branch = directory.get(selected_branch_id)
 
         # Wrap inventory display in a container
         with st.container(border=True):
             # Display the current inventory for the selected branch
             st.subheader(f"Inventory for {selected_branch['cafe_name']}")
-            inventory = selected_branch["inventory"]
-            low_stock_thresholds = {
-                'coffee_beans': 100,
-                'cup': 50,
-                'milk': 20,
-                'sugar': 10
-            }
+            # Read stock directly (summed across shards) so levels are never stale after a restock
+            inventory = get_branch_inventory(selected_branch_id, max_age=0) or {}
+            thresholds = low_stock_thresholds(selected_branch)
 
             # Check for low stock items
-            low_stock_items = []
-            for item_key, stock in inventory.items():
-                display_name = ITEM_DISPLAY_NAMES.get(item_key, item_key.replace('_', ' ').title())
-                threshold = low_stock_thresholds.get(item_key, 50)
-                if stock < threshold:
-                    low_stock_items.append({"Item": display_name, "Stock": stock, "Threshold": threshold})
+            low_stock_items = [
+                {
+                    "Item": ITEM_DISPLAY_NAMES.get(item_key, item_key.replace('_', ' ').title()),
+                    "Stock": inventory[item_key],
+                    "Threshold": threshold_for(thresholds, item_key),
+                }
+                for item_key in find_low_stock(inventory, thresholds)
+            ]
 
             if low_stock_items:
                 st.warning("The following items are low on stock:")
@@ -77,11 +111,8 @@ def inventory_management():
             restock_qty = st.number_input("Restock Quantity", min_value=1, step=1)
 
             if st.button("Restock"):
-                # Update the inventory for the selected branch
-                new_stock = inventory[restock_item_key] + restock_qty
-                db.collection("branches").document(selected_branch["id"]).update({
-                    f"inventory.{restock_item_key}": new_stock
-                })
+                # Increment the stock for the selected branch, spread across its inventory shards
+                restock_inventory(selected_branch["id"], restock_item_key, restock_qty)
 
                 # Store the success message in session state
                 st.session_state["restock_message"] = (
@@ -90,5 +121,54 @@ def inventory_management():
 
                 # Refresh the page to show updated inventory and show the success message
                 st.rerun()
+
+        # Wrap the branch's low-stock threshold overrides in a container
+        with st.container(border=True):
+            st.subheader("Low-Stock Thresholds")
+            st.write("Chain defaults apply unless this branch overrides them.")
+            new_thresholds = {}
+            for item_key in sorted(set(inventory) | set(LOW_STOCK_THRESHOLDS)):
+                display_name = ITEM_DISPLAY_NAMES.get(item_key, item_key.replace('_', ' ').title())
+                new_thresholds[item_key] = int(st.number_input(
+                    f"{display_name} threshold",
+                    min_value=0,
+                    step=1,
+                    value=int(threshold_for(thresholds, item_key)),
+                    key=f"threshold_{selected_branch_id}_{item_key}",
+                ))
+            if st.button("Save Thresholds"):
+                # Store only the values that differ from the chain defaults
+                overrides = {
+                    item_key: value for item_key, value in new_thresholds.items()
+                    if value != threshold_for(LOW_STOCK_THRESHOLDS, item_key)
+                }
+                db.collection("branches").document(selected_branch_id).update({"low_stock_thresholds": overrides})
+                update_low_stock_flag(selected_branch_id, inventory, low_stock_thresholds({"low_stock_thresholds": overrides}))
+                directory.invalidate()
+                st.session_state["restock_message"] = f"Low-stock thresholds saved for {selected_branch['cafe_name']}."
+                st.rerun()
+
+        # Wrap inventory sharding settings in a container
+        with st.container(border=True):
+            st.subheader("Inventory Shards")
+            st.write(
+                "Busy branches can split their stock across several shard documents so "
+                "concurrent checkouts do not contend on a single inventory document."
+            )
+            current_shards = shard_count(selected_branch)
+            new_shards = st.number_input(
+                "Number of Shards",
+                min_value=1,
+                max_value=MAX_INVENTORY_SHARDS,
+                step=1,
+                value=max(current_shards, 1),
+            )
+            if st.button("Apply Shard Count"):
+                configure_inventory_shards(selected_branch["id"], int(new_shards))
+                directory.invalidate()
+                st.session_state["restock_message"] = (
+                    f"Inventory for {selected_branch['cafe_name']} now uses {int(new_shards)} shard(s)."
+                )
+                st.rerun()
     else:
         st.warning("No branches available. Please add branches to manage inventory.")
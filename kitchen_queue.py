@@ -0,0 +1,59 @@
+# kitchen_queue.py
+import streamlit as st
+from firebase_init import commit_in_batches, db
+from listener_cache import ListenerCache
+from order_times import now, to_datetime
+
+# Reload interval (seconds) used when the snapshot listener is unavailable
+KITCHEN_QUEUE_TTL = 5
+
+
+class KitchenQueue(ListenerCache):
+    """Live list of a branch's unprepared orders.
+
+    Kept current by an ``on_snapshot`` listener on ``orders where branch_id ==
+    X and prepared_time == None`` (or a short TTL when no listener is
+    available), so refreshing the queue does not re-query Firestore.
+    """
+
+    def __init__(self, branch_id, ttl=KITCHEN_QUEUE_TTL):
+        self._branch_id = branch_id
+        self._orders = {}
+        super().__init__(ttl)
+
+    def _query(self):
+        return db.collection("orders") \
+            .where("branch_id", "==", self._branch_id) \
+            .where("prepared_time", "==", None)
+
+    def _rebuild(self, docs):
+        orders = {doc.id: {"Order ID": doc.id, **doc.to_dict()} for doc in docs}
+        with self._lock:
+            self._orders = orders
+
+    def orders(self):
+        """Return the unprepared orders, oldest first."""
+        self._ensure_fresh()
+        with self._lock:
+            orders = list(self._orders.values())
+        return sorted(orders, key=lambda order: to_datetime(order.get("order_time")) or now())
+
+    def mark_prepared(self, order_ids):
+        """Mark orders prepared with one batched write per 500 orders; returns the prepared time."""
+        prepared_time = now()
+        order_ids = list(order_ids)
+        commit_in_batches(
+            ("update", db.collection("orders").document(order_id), {"prepared_time": prepared_time})
+            for order_id in order_ids
+        )
+        # Drop them now rather than waiting for the listener to catch up
+        with self._lock:
+            for order_id in order_ids:
+                self._orders.pop(order_id, None)
+        return prepared_time
+
+
+@st.cache_resource
+def get_kitchen_queue(branch_id):
+    # One queue (and one listener) per branch per server process
+    return KitchenQueue(branch_id)
@@ -0,0 +1,84 @@
+# listener_cache.py
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# How long the first lookup waits for the listener's first snapshot before giving up on it
+LISTENER_READY_TIMEOUT = 5
+
+
+class ListenerCache:
+    """Process-wide cache of one Firestore query, kept fresh by an ``on_snapshot`` listener.
+
+    Subclasses provide ``_query()`` and ``_rebuild(docs)`` and call
+    ``_ensure_fresh()`` before every lookup. If the listener cannot be
+    attached, does not deliver its first snapshot within
+    ``LISTENER_READY_TIMEOUT``, or stops streaming later on, it is dropped
+    and the cache re-reads the query once its ``ttl`` has passed.
+    """
+
+    def __init__(self, ttl):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._ttl = ttl
+        self._loaded_at = 0.0
+        self._listener_failed = False
+        self._watch = None
+        try:
+            self._watch = self._query().on_snapshot(self._on_snapshot)
+        except Exception:
+            logger.warning("%s could not attach a snapshot listener; reloading every %ss", type(self).__name__, ttl, exc_info=True)
+
+    def _query(self):
+        raise NotImplementedError
+
+    def _rebuild(self, docs):
+        raise NotImplementedError
+
+    def _load(self, docs):
+        self._rebuild(docs)
+        with self._lock:
+            self._loaded_at = time.monotonic()
+
+    def _on_snapshot(self, docs, changes, read_time):
+        try:
+            self._load(docs)
+        except Exception:
+            logger.exception("%s failed to apply a snapshot", type(self).__name__)
+            self._listener_failed = True
+        self._ready.set()
+
+    def _detach(self, reason):
+        with self._lock:
+            watch, self._watch = self._watch, None
+        if watch is None:
+            return  # Another session already fell back
+        logger.warning("%s snapshot listener %s; reloading every %ss instead", type(self).__name__, reason, self._ttl)
+        try:
+            watch.unsubscribe()
+        except Exception:
+            pass
+
+    def _ensure_fresh(self):
+        watch = self._watch
+        if watch is not None:
+            # Only the first lookup after start-up can wait; a listener that misses it is dropped
+            if not self._ready.wait(timeout=LISTENER_READY_TIMEOUT):
+                self._detach(f"delivered no snapshot within {LISTENER_READY_TIMEOUT}s")
+            elif self._listener_failed or not getattr(watch, "is_active", True):
+                self._detach("stopped streaming")
+            else:
+                return
+        if time.monotonic() - self._loaded_at > self._ttl:
+            self.reload()
+
+    def reload(self):
+        """Re-read the query directly."""
+        self._load(self._query().stream())
+
+    def invalidate(self):
+        """Force the next lookup to reload when running without a listener."""
+        with self._lock:
+            self._loaded_at = 0.0
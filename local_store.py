@@ -0,0 +1,696 @@
+# local_store.py
+"""Local stand-in for the Firestore client.
+
+Implements the subset of the ``google.cloud.firestore`` API used by this app
+(collections, documents, ``where``/``order_by``/``limit`` queries,
+aggregation queries, batches, transactions and field transforms) on top of an in-memory dict. Passing a
+``path`` persists every committed write to a SQLite file so data survives
+restarts. Used for offline development, profiling and load tests.
+"""
+import copy
+import datetime
+import logging
+import sqlite3
+import threading
+import types
+import uuid
+
+import datetime_json
+
+logger = logging.getLogger(__name__)
+
+
+class _Sentinel:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+# Field sentinels mirroring firestore.SERVER_TIMESTAMP / firestore.DELETE_FIELD
+SERVER_TIMESTAMP = _Sentinel("SERVER_TIMESTAMP")
+DELETE_FIELD = _Sentinel("DELETE_FIELD")
+
+
+class Increment:
+    """Numeric increment transform, like ``firestore.Increment``."""
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _new_id():
+    return uuid.uuid4().hex[:20]
+
+
+class LastUpdateOption:
+    """Write precondition, like ``client.write_option(last_update_time=...)``."""
+
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+    def check(self, reference, update_time):
+        if update_time != self.last_update_time:
+            raise ValueError(f"Precondition failed: {reference.path} changed since {self.last_update_time}")
+
+
+class WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _split_path(field_path):
+    return field_path.replace("`", "").split(".")
+
+
+def _get_field(data, field_path):
+    """Return ``(found, value)`` for a dotted field path."""
+    value = data
+    for part in _split_path(field_path):
+        if not isinstance(value, dict) or part not in value:
+            return False, None
+        value = value[part]
+    return True, value
+
+
+def _apply_value(target, key, value):
+    if value is DELETE_FIELD:
+        target.pop(key, None)
+    elif value is SERVER_TIMESTAMP:
+        target[key] = _now()
+    elif isinstance(value, Increment):
+        current = target.get(key)
+        target[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+    else:
+        target[key] = _resolve(value)
+
+
+def _resolve(value):
+    """Deep-copy a value, replacing transforms nested inside plain writes."""
+    if isinstance(value, dict):
+        resolved = {}
+        for key, item in value.items():
+            _apply_value(resolved, key, item)
+        return resolved
+    if isinstance(value, list):
+        return [_resolve(item) for item in value]
+    return copy.deepcopy(value)
+
+
+def _merge(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            _apply_value(target, key, value)
+
+
+def _update(target, data):
+    for field_path, value in data.items():
+        parts = _split_path(field_path)
+        node = target
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        _apply_value(node, parts[-1], value)
+
+
+# Firestore orders values of different types by type first
+_TYPE_ORDER = [type(None), bool, (int, float), datetime.datetime, str, bytes, list, dict]
+
+
+def _sort_key(value):
+    for rank, kind in enumerate(_TYPE_ORDER):
+        if isinstance(value, kind) and not (kind is not bool and isinstance(value, bool)):
+            if isinstance(value, datetime.datetime) and value.tzinfo is None:
+                value = value.replace(tzinfo=datetime.timezone.utc)
+            if isinstance(value, dict):
+                value = sorted(value.items())
+            return rank, value
+    return len(_TYPE_ORDER), str(value)
+
+
+def _compare(left, op, right):
+    if op == "in":
+        return left in right
+    if op == "not-in":
+        return left not in right
+    if op == "array-contains":
+        return isinstance(left, list) and right in left
+    if op == "array-contains-any":
+        return isinstance(left, list) and any(value in left for value in right)
+    if op == "==":
+        return _sort_key(left) == _sort_key(right)
+    if op == "!=":
+        return _sort_key(left) != _sort_key(right)
+    # Range filters only match values of the same type
+    left_key, right_key = _sort_key(left), _sort_key(right)
+    if left_key[0] != right_key[0]:
+        return False
+    if op == "<":
+        return left_key < right_key
+    if op == "<=":
+        return left_key <= right_key
+    if op == ">":
+        return left_key > right_key
+    if op == ">=":
+        return left_key >= right_key
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+class DocumentChange:
+    def __init__(self, change_type, document):
+        self.type = types.SimpleNamespace(name=change_type)
+        self.document = document
+
+
+class Watch:
+    """Handle returned by ``on_snapshot``; mirrors ``google.cloud.firestore.Watch``."""
+
+    def __init__(self, client, collection_path, run, callback):
+        self._client = client
+        self._collection_path = collection_path
+        self._run = run
+        self._callback = callback
+        self._seen = {}
+        self._delivered = False
+        self._active = True
+        self._notify_lock = threading.Lock()
+
+    @property
+    def is_active(self):
+        return self._active
+
+    def _notify(self):
+        with self._notify_lock:
+            self._deliver()
+
+    def _deliver(self):
+        with self._client._lock:
+            snapshots = self._run()
+        current = {snapshot.id: snapshot for snapshot in snapshots}
+        changes = []
+        for doc_id, snapshot in current.items():
+            if doc_id not in self._seen:
+                changes.append(DocumentChange("ADDED", snapshot))
+            elif self._seen[doc_id] != snapshot._data:
+                changes.append(DocumentChange("MODIFIED", snapshot))
+        for doc_id in self._seen.keys() - current.keys():
+            changes.append(DocumentChange("REMOVED", DocumentSnapshot(
+                DocumentReference(self._client, self._collection_path, doc_id), None
+            )))
+        self._seen = {doc_id: snapshot._data for doc_id, snapshot in current.items()}
+        self._client._record_usage(reads=len(changes))
+        if changes or not self._delivered:
+            self._delivered = True
+            try:
+                self._callback(snapshots, changes, _now())
+            except Exception:
+                logger.exception("Snapshot listener callback failed")
+
+    def unsubscribe(self):
+        self._active = False
+        with self._client._lock:
+            if self in self._client._watches:
+                self._client._watches.remove(self)
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self._data = data
+        self.update_time = update_time
+        self.read_time = _now()
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        found, value = _get_field(self._data or {}, field_path)
+        if not found:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class DocumentReference:
+    def __init__(self, client, collection_path, document_id):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = document_id
+
+    @property
+    def path(self):
+        return f"{self._collection_path}/{self.id}"
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self._collection_path)
+
+    def collection(self, collection_id):
+        return CollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def on_snapshot(self, callback):
+        def run():
+            snapshot = self._client._snapshot(self)
+            return [snapshot] if snapshot.exists else []
+
+        return self._client._watch(self._collection_path, run, callback)
+
+    def get(self, field_paths=None, transaction=None):
+        self._client._record_usage(reads=1)
+        return self._client._snapshot(self)
+
+    def create(self, document_data):
+        batch = self._client.batch()
+        batch.create(self, document_data)
+        batch.commit()
+
+    def set(self, document_data, merge=False):
+        batch = self._client.batch()
+        batch.set(self, document_data, merge=merge)
+        batch.commit()
+
+    def update(self, field_updates, option=None):
+        batch = self._client.batch()
+        batch.update(self, field_updates, option=option)
+        batch.commit()
+
+    def delete(self):
+        batch = self._client.batch()
+        batch.delete(self)
+        batch.commit()
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+class Query:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, client, collection_path, filters=(), orders=(), limit=None, start_after=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "start_after": self._start_after,
+        }
+        state.update(changes)
+        return Query(self._client, self._collection_path, **state)
+
+    def where(self, field_path, op_string, value):
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start_after=document_fields_or_snapshot)
+
+    def _matches(self, data):
+        for field_path, op, value in self._filters:
+            found, field_value = _get_field(data, field_path)
+            if not found or not _compare(field_value, op, value):
+                return False
+        for field_path, _ in self._orders:
+            if not _get_field(data, field_path)[0]:
+                return False  # Firestore drops documents missing an order_by field
+        return True
+
+    def _cursor_key(self, document_id, data):
+        key = []
+        for field_path, direction in self._orders:
+            rank = _sort_key(_get_field(data, field_path)[1])
+            key.append(_Reversed(rank) if direction == self.DESCENDING else rank)
+        last_direction = self._orders[-1][1] if self._orders else self.ASCENDING
+        key.append(_Reversed(document_id) if last_direction == self.DESCENDING else document_id)
+        return key
+
+    def _run(self):
+        documents = self._client._documents(self._collection_path)
+        rows = [(doc_id, data) for doc_id, data in documents.items() if self._matches(data)]
+        rows.sort(key=lambda row: self._cursor_key(*row))
+        if self._start_after is not None:
+            if isinstance(self._start_after, DocumentSnapshot):
+                cursor_id, cursor_data = self._start_after.id, self._start_after._data or {}
+            else:
+                cursor_id, cursor_data = "", self._start_after
+            cursor = self._cursor_key(cursor_id, cursor_data)
+            if not isinstance(self._start_after, DocumentSnapshot):
+                cursor = cursor[:-1]
+            rows = [row for row in rows if self._cursor_key(*row)[:len(cursor)] > cursor]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        update_times = self._client._update_times
+        return [
+            DocumentSnapshot(
+                DocumentReference(self._client, self._collection_path, doc_id), copy.deepcopy(data),
+                update_times.get((self._collection_path, doc_id)),
+            )
+            for doc_id, data in rows
+        ]
+
+    def stream(self, transaction=None):
+        with self._client._lock:
+            snapshots = self._run()
+        # Firestore bills one read per returned document, and at least one per query
+        self._client._record_usage(reads=max(len(snapshots), 1))
+        yield from snapshots
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        return self._client._watch(self._collection_path, self._run, callback)
+
+    def count(self, alias=None):
+        return AggregationQuery(self).count(alias=alias)
+
+    def sum(self, field_ref, alias=None):
+        return AggregationQuery(self).sum(field_ref, alias=alias)
+
+    def avg(self, field_ref, alias=None):
+        return AggregationQuery(self).avg(field_ref, alias=alias)
+
+
+class AggregationResult:
+    def __init__(self, alias, value, read_time=None):
+        self.alias = alias
+        self.value = value
+        self.read_time = read_time
+
+
+class AggregationQuery:
+    """``count``/``sum``/``avg`` over a query, computed client-side."""
+
+    def __init__(self, nested_query):
+        self._nested_query = nested_query
+        self._aggregations = []
+
+    def _add(self, kind, field_path, alias):
+        self._aggregations.append((kind, field_path, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def count(self, alias=None):
+        return self._add("count", None, alias)
+
+    def sum(self, field_ref, alias=None):
+        return self._add("sum", field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return self._add("avg", field_ref, alias)
+
+    def get(self, transaction=None):
+        with self._nested_query._client._lock:
+            documents = [snapshot._data for snapshot in self._nested_query._run()]
+        # Aggregations bill one read per batch of up to 1000 index entries
+        self._nested_query._client._record_usage(reads=max((len(documents) + 999) // 1000, 1))
+        read_time = _now()
+        results = []
+        for kind, field_path, alias in self._aggregations:
+            if kind == "count":
+                value = len(documents)
+            else:
+                # Firestore skips values that are missing or not numeric
+                numbers = []
+                for data in documents:
+                    found, field_value = _get_field(data, field_path)
+                    if found and isinstance(field_value, (int, float)) and not isinstance(field_value, bool):
+                        numbers.append(field_value)
+                if kind == "sum":
+                    value = sum(numbers)
+                else:
+                    value = sum(numbers) / len(numbers) if numbers else None
+            results.append(AggregationResult(alias, value, read_time))
+        return [results]
+
+    def stream(self, transaction=None):
+        yield from self.get(transaction=transaction)
+
+
+class _Reversed:
+    """Sort wrapper that inverts comparisons for descending order_by clauses."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __gt__(self, other):
+        return self.value < other.value
+
+
+class CollectionReference(Query):
+    def __init__(self, client, collection_path):
+        super().__init__(client, collection_path)
+
+    @property
+    def id(self):
+        return self._collection_path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, self._collection_path, document_id or _new_id())
+
+    def add(self, document_data, document_id=None):
+        doc_ref = self.document(document_id)
+        doc_ref.create(document_data)
+        return _now(), doc_ref
+
+    def list_documents(self):
+        with self._client._lock:
+            ids = list(self._client._documents(self._collection_path))
+        return [self.document(doc_id) for doc_id in ids]
+
+
+class WriteBatch:
+    """Buffered writes applied atomically on ``commit``."""
+
+    MAX_WRITES = 500
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def _add(self, write):
+        if len(self._writes) >= self.MAX_WRITES:
+            raise ValueError(f"A batch can contain at most {self.MAX_WRITES} writes.")
+        self._writes.append(write)
+
+    def create(self, reference, document_data):
+        self._add(("create", reference, document_data, None))
+
+    def set(self, reference, document_data, merge=False):
+        self._add(("merge" if merge else "set", reference, document_data, None))
+
+    def update(self, reference, field_updates, option=None):
+        self._add(("update", reference, field_updates, option))
+
+    def delete(self, reference, option=None):
+        self._add(("delete", reference, None, option))
+
+    def commit(self):
+        results = self._client._commit(self._writes)
+        self._writes = []
+        return results
+
+
+class Transaction(WriteBatch):
+    """Transaction whose writes commit atomically while the client lock is held."""
+
+    def __init__(self, client):
+        super().__init__(client)
+        self.in_progress = False
+
+
+def transactional(func):
+    """Decorator mirroring ``firestore.transactional`` for local transactions."""
+
+    def wrapper(transaction, *args, **kwargs):
+        with transaction._client._lock:
+            transaction.in_progress = True
+            try:
+                result = func(transaction, *args, **kwargs)
+                transaction.commit()
+                return result
+            finally:
+                transaction._writes = []
+                transaction.in_progress = False
+
+    return wrapper
+
+
+class Client:
+    """In-memory Firestore stand-in, optionally persisted to SQLite."""
+
+    def __init__(self, path=None):
+        self._lock = threading.RLock()
+        self._collections = {}
+        self._watches = []
+        self._usage = {"reads": 0, "writes": 0}
+        self._update_times = {}  # (collection, id) -> time of the last write to that document
+        self._last_commit_time = _now()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " collection TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL,"
+                " PRIMARY KEY (collection, id))"
+            )
+            for collection_path, doc_id, data in self._conn.execute("SELECT collection, id, data FROM documents"):
+                self._collections.setdefault(collection_path, {})[doc_id] = datetime_json.loads(data)
+                self._update_times[(collection_path, doc_id)] = self._last_commit_time
+
+    def collection(self, collection_path):
+        return CollectionReference(self, collection_path)
+
+    def document(self, document_path):
+        collection_path, document_id = document_path.rsplit("/", 1)
+        return DocumentReference(self, collection_path, document_id)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return Transaction(self)
+
+    @staticmethod
+    def write_option(last_update_time):
+        return LastUpdateOption(last_update_time)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        with self._lock:
+            snapshots = [self._snapshot(reference) for reference in references]
+        self._record_usage(reads=len(snapshots))
+        yield from snapshots
+
+    def usage(self):
+        """Return the documents read and written so far, counted the way Firestore bills them."""
+        with self._lock:
+            return dict(self._usage)
+
+    def reset_usage(self):
+        with self._lock:
+            self._usage = {"reads": 0, "writes": 0}
+
+    def _record_usage(self, reads=0, writes=0):
+        with self._lock:
+            self._usage["reads"] += reads
+            self._usage["writes"] += writes
+
+    def collections(self):
+        with self._lock:
+            paths = [path for path in self._collections if "/" not in path]
+        return [self.collection(path) for path in paths]
+
+    def _watch(self, collection_path, run, callback):
+        watch = Watch(self, collection_path, run, callback)
+        with self._lock:
+            self._watches.append(watch)
+        watch._notify()
+        return watch
+
+    def _documents(self, collection_path):
+        return self._collections.get(collection_path, {})
+
+    def _snapshot(self, reference):
+        with self._lock:
+            data = self._documents(reference._collection_path).get(reference.id)
+            update_time = self._update_times.get((reference._collection_path, reference.id))
+            return DocumentSnapshot(reference, copy.deepcopy(data), update_time)
+
+    def _commit(self, writes):
+        with self._lock:
+            # Apply to copies first so a failing write leaves the store untouched
+            staged = {}
+            for kind, reference, data, option in writes:
+                key = (reference._collection_path, reference.id)
+                if option is not None:
+                    option.check(reference, self._update_times.get(key))
+                if key not in staged:
+                    current = self._documents(reference._collection_path).get(reference.id)
+                    staged[key] = copy.deepcopy(current)
+                current = staged[key]
+                if kind == "create":
+                    if current is not None:
+                        raise ValueError(f"Document already exists: {reference.path}")
+                    staged[key] = _resolve(data)
+                elif kind == "set":
+                    staged[key] = _resolve(data)
+                elif kind == "merge":
+                    current = current or {}
+                    _merge(current, data)
+                    staged[key] = current
+                elif kind == "update":
+                    if current is None:
+                        raise ValueError(f"No document to update: {reference.path}")
+                    _update(current, data)
+                elif kind == "delete":
+                    staged[key] = None
+            # Every write in a commit shares one update time, strictly later than the previous commit's
+            commit_time = max(_now(), self._last_commit_time + datetime.timedelta(microseconds=1))
+            self._last_commit_time = commit_time
+            for (collection_path, doc_id), data in staged.items():
+                documents = self._collections.setdefault(collection_path, {})
+                if data is None:
+                    documents.pop(doc_id, None)
+                    self._update_times.pop((collection_path, doc_id), None)
+                else:
+                    documents[doc_id] = data
+                    self._update_times[(collection_path, doc_id)] = commit_time
+            self._persist(staged)
+            self._record_usage(writes=len(writes))
+            touched = {collection_path for collection_path, _ in staged}
+            watches = [watch for watch in self._watches if watch._collection_path in touched]
+        # Deliver snapshots outside the lock, as Firestore does from its watch thread
+        for watch in watches:
+            watch._notify()
+        return [WriteResult(commit_time) for _ in writes]
+
+    def _persist(self, staged):
+        if self._conn is None:
+            return
+        with self._conn:
+            for (collection_path, doc_id), data in staged.items():
+                if data is None:
+                    self._conn.execute(
+                        "DELETE FROM documents WHERE collection = ? AND id = ?", (collection_path, doc_id)
+                    )
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO documents (collection, id, data) VALUES (?, ?, ?)",
+                        (collection_path, doc_id, datetime_json.dumps(data)),
+                    )
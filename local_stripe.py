@@ -0,0 +1,289 @@
+# local_stripe.py
+"""A small stripe-mock style stand-in for the Stripe endpoints this app uses.
+
+Run it with ``python local_stripe.py [--port 12111] [--latency-ms 0]`` and
+point the app at it with ``COFFEE_APP_STRIPE_API_BASE=http://localhost:12111``
+to exercise and benchmark checkout offline. Unlike stripe-mock it keeps the
+objects it creates, so lookups and listings return them.
+"""
+import argparse
+import json
+import operator
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+DEFAULT_PORT = 12111
+
+
+def _new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def _listify(value):
+    # Form keys such as line_items[0][price] arrive as dicts with numeric keys
+    if isinstance(value, dict):
+        value = {key: _listify(item) for key, item in value.items()}
+        if value and all(key.isdigit() for key in value):
+            return [value[key] for key in sorted(value, key=int)]
+    return value
+
+
+def _decode_form(body):
+    """Decode Stripe's bracketed form encoding into nested dicts and lists."""
+    params = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        parts = re.findall(r"[^\[\]]+", key)
+        target = params
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return _listify(params)
+
+
+def _as_bool(value):
+    return value in (True, "true", "True", "1")
+
+
+class StripeState:
+    """In-memory products, prices, checkout sessions and refunds."""
+
+    def __init__(self, auto_pay=False):
+        self.lock = threading.Lock()
+        self.auto_pay = auto_pay
+        self.products = {}
+        self.prices = {}
+        self.sessions = {}
+        self.refunds = {}
+
+    def create_product(self, params):
+        product = {
+            "id": _new_id("prod"),
+            "object": "product",
+            "active": True,
+            "created": int(time.time()),
+            "name": params.get("name", ""),
+            "metadata": params.get("metadata", {}),
+        }
+        self.products[product["id"]] = product
+        return product
+
+    def create_price(self, params):
+        if "product_data" in params:
+            product_id = self.create_product(params["product_data"])["id"]
+        else:
+            product_id = params["product"]
+        lookup_key = params.get("lookup_key")
+        if lookup_key:
+            holders = [p for p in self.prices.values() if p["lookup_key"] == lookup_key]
+            if holders and not _as_bool(params.get("transfer_lookup_key")):
+                raise ValueError(f"A price with lookup_key '{lookup_key}' already exists.")
+            for holder in holders:
+                holder["lookup_key"] = None
+        price = {
+            "id": _new_id("price"),
+            "object": "price",
+            "active": True,
+            "created": int(time.time()),
+            "currency": params["currency"],
+            "unit_amount": int(params["unit_amount"]),
+            "product": product_id,
+            "lookup_key": lookup_key,
+            "metadata": params.get("metadata", {}),
+            "type": "one_time",
+        }
+        self.prices[price["id"]] = price
+        return price
+
+    def update_price(self, price_id, params):
+        price = self.prices[price_id]
+        if "active" in params:
+            price["active"] = _as_bool(params["active"])
+        price["metadata"].update(params.get("metadata", {}))
+        return price
+
+    def list_prices(self, params):
+        prices = list(self.prices.values())
+        if "lookup_keys" in params:
+            prices = [p for p in prices if p["lookup_key"] in params["lookup_keys"]]
+        if "active" in params:
+            prices = [p for p in prices if p["active"] == _as_bool(params["active"])]
+        return prices
+
+    def create_session(self, params):
+        line_items = params.get("line_items", [])
+        amount_total = 0
+        for item in line_items:
+            if "price" in item:
+                unit_amount = self.prices[item["price"]]["unit_amount"]
+            else:
+                unit_amount = int(item["price_data"]["unit_amount"])
+            amount_total += unit_amount * int(item.get("quantity", 1))
+        session_id = _new_id("cs_test")
+        session = {
+            "id": session_id,
+            "object": "checkout.session",
+            "amount_total": amount_total,
+            "client_reference_id": params.get("client_reference_id"),
+            "created": int(time.time()),
+            "currency": "myr",
+            "metadata": params.get("metadata", {}),
+            "mode": params.get("mode", "payment"),
+            "payment_intent": None,
+            "payment_status": "unpaid",
+            "status": "open",
+            "success_url": params.get("success_url"),
+            "cancel_url": params.get("cancel_url"),
+            "url": f"https://checkout.stripe.com/c/pay/{session_id}",
+        }
+        self.sessions[session_id] = session
+        if self.auto_pay:
+            self.complete_session(session_id)
+        return session
+
+    def complete_session(self, session_id):
+        """Mark a session as paid, as if the customer finished checkout."""
+        session = self.sessions[session_id]
+        session.update({"payment_intent": _new_id("pi"), "payment_status": "paid", "status": "complete"})
+        return session
+
+    def expire_session(self, session_id):
+        session = self.sessions[session_id]
+        if session["status"] != "open":
+            raise ValueError(f"Only Checkout Sessions with a status of open can be expired; {session_id} is {session['status']}.")
+        session["status"] = "expired"
+        return session
+
+    def create_refund(self, params):
+        payment_intent = params["payment_intent"]
+        session = next((s for s in self.sessions.values() if s["payment_intent"] == payment_intent), None)
+        if session is None:
+            raise ValueError(f"No such payment_intent: '{payment_intent}'")
+        if any(r["payment_intent"] == payment_intent for r in self.refunds.values()):
+            raise ValueError(f"Charge for {payment_intent} has already been refunded.")
+        refund = {
+            "id": _new_id("re"),
+            "object": "refund",
+            "amount": int(params.get("amount", session["amount_total"])),
+            "created": int(time.time()),
+            "currency": session["currency"],
+            "payment_intent": payment_intent,
+            "status": "succeeded",
+        }
+        self.refunds[refund["id"]] = refund
+        return refund
+
+    def list_sessions(self, params):
+        sessions = list(self.sessions.values())
+        created = params.get("created")
+        if isinstance(created, dict):
+            for op, test in (("gt", operator.gt), ("gte", operator.ge), ("lt", operator.lt), ("lte", operator.le)):
+                if op in created:
+                    sessions = [s for s in sessions if test(s["created"], int(created[op]))]
+        if "status" in params:
+            sessions = [s for s in sessions if s["status"] == params["status"]]
+        return sessions
+
+
+class StripeHandler(BaseHTTPRequestHandler):
+    state = None
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output quiet
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Request-Id", _new_id("req"))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, {"error": {"type": "invalid_request_error", "message": message}})
+
+    def _list(self, path, objects, params):
+        # Newest first, with ties kept in creation order as Stripe does
+        objects = list(reversed(sorted(objects, key=lambda o: o["created"])))
+        if params.get("starting_after"):
+            ids = [o["id"] for o in objects]
+            objects = objects[ids.index(params["starting_after"]) + 1:]
+        limit = int(params.get("limit", 10))
+        return {"object": "list", "url": path, "data": objects[:limit], "has_more": len(objects) > limit}
+
+    def _handle(self, method):
+        if self.latency:
+            time.sleep(self.latency)  # Simulated network round trip
+        url = urlsplit(self.path)
+        if method == "GET":
+            params = _decode_form(url.query)
+        else:
+            length = int(self.headers.get("Content-Length", 0))
+            params = _decode_form(self.rfile.read(length).decode())
+        path = url.path.rstrip("/")
+        state = self.state
+        try:
+            with state.lock:
+                if method == "POST" and path == "/v1/products":
+                    return self._send(200, state.create_product(params))
+                if method == "POST" and path == "/v1/prices":
+                    return self._send(200, state.create_price(params))
+                if method == "GET" and path == "/v1/prices":
+                    return self._send(200, self._list(path, state.list_prices(params), params))
+                match = re.fullmatch(r"/v1/prices/([\w-]+)", path)
+                if match and match.group(1) in state.prices:
+                    if method == "POST":
+                        return self._send(200, state.update_price(match.group(1), params))
+                    return self._send(200, state.prices[match.group(1)])
+                if method == "POST" and path == "/v1/checkout/sessions":
+                    return self._send(200, state.create_session(params))
+                if method == "GET" and path == "/v1/checkout/sessions":
+                    return self._send(200, self._list(path, state.list_sessions(params), params))
+                match = re.fullmatch(r"/v1/checkout/sessions/([\w-]+)", path)
+                if method == "GET" and match and match.group(1) in state.sessions:
+                    return self._send(200, state.sessions[match.group(1)])
+                match = re.fullmatch(r"/v1/checkout/sessions/([\w-]+)/expire", path)
+                if method == "POST" and match and match.group(1) in state.sessions:
+                    return self._send(200, state.expire_session(match.group(1)))
+                if method == "POST" and path == "/v1/refunds":
+                    return self._send(200, state.create_refund(params))
+            return self._error(404, f"Unrecognized request URL ({method}: {url.path}).")
+        except (KeyError, ValueError) as e:
+            return self._error(400, str(e))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def serve(port=DEFAULT_PORT, latency_ms=0, state=None, auto_pay=False):
+    """Start the stand-in on ``port`` in a daemon thread and return the server."""
+    state = state or StripeState(auto_pay=auto_pay)
+    handler = type("Handler", (StripeHandler,), {"state": state, "latency": latency_ms / 1000})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="local-stripe", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every request")
+    parser.add_argument("--auto-pay", action="store_true", help="Mark checkout sessions paid as soon as they are created")
+    args = parser.parse_args()
+    server = serve(args.port, args.latency_ms, auto_pay=args.auto_pay)
+    print(f"Local Stripe listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
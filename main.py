@@ -1,44 +1,39 @@
 # main.py
 import streamlit as st
+from page_registry import ADMIN_PAGES, CUSTOMER_PAGES, get_page_timings, render_page, startup_timing_report
 from firebase_init import db  # Firebase setup
+from firestore_trace import firestore_usage_report, trace_rerun
 from auth import authenticate_user, initialize_session_state, login_signup
-from menu import menu
-from inventory import inventory_management
-from sales_reporting import sales_reporting
-from analytics import analytics_dashboard
-from promotions import promotions_management
-from order import customer_order
-from order_history import order_history
-from pickup_notification import pickup_notification
-from feedback import feedback
-from notification import notification_management
-from about_us import about_us
-from utils import validate_branch_inventory
+from promotion_sweeper import start_promotion_sweeper
+from payment_reconciler import start_payment_reconciler
+from order_outbox import get_order_outbox, order_outbox_report
 
 # Initialize session state
 initialize_session_state()
 
+# Start the process-wide background sweeper for expired promotions
+start_promotion_sweeper()
+
+# Start the process-wide background job that records Stripe payment statuses on orders
+start_payment_reconciler()
+
+# Start the process-wide order outbox flusher; orders queued before a restart are committed first
+get_order_outbox()
+
+# Record the cold-start time once the app is ready to render its first page
+get_page_timings()
+
 # Login and Signup Page
 if not st.session_state["authenticated_user"]:
-    login_signup()
+    with trace_rerun("Login"):
+        login_signup()
 else:
     if st.session_state["role"] == "admin":
-        nav = st.sidebar.radio(
-            "Admin Navigation",
-            [
-                "Inventory Management",
-                "Sales Reporting",
-                "Analytics Dashboard",
-                "Promotions & Discounts",
-                "Notification",
-                "About Us"
-            ],
-        )
+        pages = ADMIN_PAGES
+        nav = st.sidebar.radio("Admin Navigation", list(pages))
     else:
-        nav = st.sidebar.radio(
-            "Customer Navigation",
-            ["Order", "Order History", "Pickup Notification", "Feedback", "About Us"],
-        )
+        pages = CUSTOMER_PAGES
+        nav = st.sidebar.radio("Customer Navigation", list(pages))
 
     # Logout button
     if st.sidebar.button("Log out"):
@@ -46,28 +41,16 @@ else:
         st.session_state["role"] = None
         st.rerun()
 
-    # Navigation
+    # Admins can see how long startup and each page took, and any orders not yet committed
     if st.session_state["role"] == "admin":
-        if nav == "Inventory Management":
-            inventory_management()
-        elif nav == "Sales Reporting":
-            sales_reporting()
-        elif nav == "Analytics Dashboard":
-            analytics_dashboard()
-        elif nav == "Promotions & Discounts":
-            promotions_management()
-        elif nav == "Notification":
-            notification_management()
-        elif nav == "About Us":
-            about_us()
-    else:
-        if nav == "Order":
-            customer_order()
-        elif nav == "Order History":
-            order_history()
-        elif nav == "Pickup Notification":
-            pickup_notification()
-        elif nav == "Feedback":
-            feedback()
-        elif nav == "About Us":
-            about_us()
+        startup_timing_report()
+        order_outbox_report()
+
+    # Firestore reads, writes and query times of this rerun are recorded against the page
+    with trace_rerun(nav):
+        # Navigation: the page module is imported the first time it is selected
+        render_page(nav, pages)
+
+        # Admins can see what each rerun cost in Firestore reads and writes
+        if st.session_state["role"] == "admin":
+            firestore_usage_report()
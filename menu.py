@@ -30,3 +30,15 @@ menu = {
     },
 }
 
+
+def line_amounts(item):
+    """Return the ``(price, cost)`` an order line was charged at.
+
+    Read from the line's own snapshot. Only lines saved before snapshots
+    existed (and not yet backfilled) fall back to the menu, where drinks no
+    longer sold count as 0.
+    """
+    if "price" in item and "cost" in item:
+        return item["price"], item["cost"]
+    details = menu.get(item["coffee"], {})
+    return details.get("price", 0) * item["quantity"], details.get("cost", 0) * item["quantity"]
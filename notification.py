@@ -1,110 +1,125 @@
 # notification.py
 import streamlit as st
-from firebase_init import db
 import pandas as pd
-import datetime
+from order_times import format_order_time
+from branch_directory import get_branch_directory
+from branch_inventory import find_low_stock, get_branch_inventory, low_stock_thresholds, threshold_for
+from kitchen_queue import get_kitchen_queue
+from firestore_trace import trace_fragment
+
+# Seconds between refreshes of the kitchen queue fragment
+KITCHEN_QUEUE_REFRESH = 5
+
+
+def _prepare_key(branch_id, order_id):
+    return f"prepare_{branch_id}_{order_id}"
+
+
+def _mark_prepared(queue, branch_id, order_ids, selected_only=False):
+    # Mark every chosen order prepared in one batched write
+    if selected_only:
+        order_ids = [order_id for order_id in order_ids if st.session_state.get(_prepare_key(branch_id, order_id))]
+    if not order_ids:
+        return
+    prepared_time = queue.mark_prepared(order_ids)
+    for order_id in order_ids:
+        st.session_state[_prepare_key(branch_id, order_id)] = False
+    st.session_state["kitchen_queue_message"] = (
+        f"{len(order_ids)} order(s) marked as Prepared at {format_order_time(prepared_time)}."
+    )
+
+
+@st.fragment(run_every=KITCHEN_QUEUE_REFRESH)
+@trace_fragment("Notification")
+def _kitchen_queue(branch_id, branch_name):
+    # Only this fragment reruns on refresh; the queue itself is kept current by a listener
+    st.subheader(f"Order Ready Notifications for {branch_name}")
+    queue = get_kitchen_queue(branch_id)
+    unprepared_orders = queue.orders()
+
+    if st.session_state.get("kitchen_queue_message"):
+        st.success(st.session_state.pop("kitchen_queue_message"))
+
+    if unprepared_orders:
+        # Wrap the unprepared orders section in a container with a border
+        with st.container(border=True):
+            # Prepare data for display
+            display_data = []
+            for order in unprepared_orders:
+                # Combine items into a single string
+                items_description = ", ".join([f"{item['quantity']}x {item['coffee']}" for item in order.get("items", [])])
+                display_data.append({
+                    "Order ID": order["Order ID"],
+                    "Order Time": format_order_time(order.get("order_time")),
+                    "Customer": order.get("customer"),
+                    "Order Details": items_description
+                })
+            st.write(f"Unprepared Orders ({len(display_data)}):")
+            st.table(pd.DataFrame(display_data))
+
+            # Tick orders to mark as prepared; keys are per order so ticks survive refreshes
+            st.write("Select orders to mark as Prepared:")
+            order_ids = [order["Order ID"] for order in display_data]
+            for order in display_data:
+                st.checkbox(
+                    f"{order['Order ID']} - {order['Customer']}: {order['Order Details']}",
+                    key=_prepare_key(branch_id, order["Order ID"]),
+                )
+            selected_order_ids = [
+                order_id for order_id in order_ids if st.session_state.get(_prepare_key(branch_id, order_id))
+            ]
+
+            # Callbacks run before the fragment re-renders, so the queue shown is already updated
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button(
+                    "Mark Selected as Prepared",
+                    disabled=not selected_order_ids,
+                    on_click=_mark_prepared,
+                    args=(queue, branch_id, order_ids, True),
+                )
+            with col2:
+                st.button(
+                    f"Mark All {len(order_ids)} as Prepared",
+                    on_click=_mark_prepared,
+                    args=(queue, branch_id, order_ids),
+                )
+    else:
+        # Display the message outside the container
+        st.info(f"No unprepared orders at the moment for {branch_name}.")
+
 
 def notification_management():
     st.title("Notification Management")
 
-    # Branch Selection
-    branches_ref = db.collection("branches").stream()
-    branches = [{"Branch Name": b.to_dict()["cafe_name"], "Branch ID": b.id} for b in branches_ref]
+    # Branch Selection from the shared branch directory
+    directory = get_branch_directory()
+    branch_names = directory.names()
 
-    if not branches:
+    if not branch_names:
         st.warning("No branches available. Please contact admin.")
     else:
-        branch_names = [branch["Branch Name"] for branch in branches]
         selected_branch_name = st.selectbox("Select Branch for Notifications", branch_names)
-        selected_branch_id = next(
-            branch["Branch ID"] for branch in branches if branch["Branch Name"] == selected_branch_name
-        )
-
-        # Order Ready Notification
-        st.subheader(f"Order Ready Notifications for {selected_branch_name}")
-
-        # Fetch unprepared orders for the selected branch
-        orders_ref = db.collection("orders") \
-            .where("branch_id", "==", selected_branch_id) \
-            .where("prepared_time", "==", None) \
-            .stream()
-
-        unprepared_orders = []
-        for o in orders_ref:
-            order_data = o.to_dict()
-            order_id = o.id
-            order_time = order_data.get("order_time")
-            customer = order_data.get("customer")
-            items = order_data.get("items", [])
-            unprepared_orders.append({
-                "Order ID": order_id,
-                "Order Time": order_time,
-                "Customer": customer,
-                "Items": items
-            })
-
-        if unprepared_orders:
-            # Wrap the unprepared orders section in a container with a border
-            container = st.container(border=True)
-            with container:
-                # Prepare data for display
-                display_data = []
-                for order in unprepared_orders:
-                    order_id = order["Order ID"]
-                    order_time = order["Order Time"]
-                    customer = order["Customer"]
-                    items = order["Items"]
-                    # Combine items into a single string
-                    items_description = ", ".join([f"{item['quantity']}x {item['coffee']}" for item in items])
-                    display_data.append({
-                        "Order ID": order_id,
-                        "Order Time": order_time,
-                        "Customer": customer,
-                        "Order Details": items_description
-                    })
-
-                # Convert to DataFrame for display
-                df_unprepared = pd.DataFrame(display_data)
-                st.write("Unprepared Orders:")
-                st.table(df_unprepared)
-
-                # Select Order to Mark as Prepared
-                selected_order_id = st.selectbox(
-                    "Select Order ID to mark as Prepared", df_unprepared["Order ID"].values
-                )
-                if st.button("Mark as Prepared"):
-                    prepared_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    db.collection("orders").document(selected_order_id).update({"prepared_time": prepared_time})
-                    st.success(f"Order ID {selected_order_id} marked as Prepared at {prepared_time}.")
-                    st.rerun()
-        else:
-            # Display the message outside the container
-            st.info(f"No unprepared orders at the moment for {selected_branch_name}.")
+        selected_branch_id = directory.id_for(selected_branch_name)
+
+        # Order Ready Notification, refreshed live from the branch's kitchen queue
+        _kitchen_queue(selected_branch_id, selected_branch_name)
 
         # Low Stock Reminder
         st.subheader(f"Low Stock Reminder for {selected_branch_name}")
 
         # Fetch Inventory for the Selected Branch
-        branch_ref = db.collection("branches").document(selected_branch_id).get()
-        branch_inventory = branch_ref.to_dict()["inventory"] if branch_ref.exists else {}
-
-        # Define thresholds and identify low stock items
-        low_stock_threshold = {
-            "coffee_beans": 100,
-            "cup": 50,
-            "milk": 20,
-            "sugar": 10
-        }
-
-        # Identify low stock items
+        branch_inventory = get_branch_inventory(selected_branch_id) or {}
+
+        # Identify low stock items against the branch's thresholds
+        thresholds = low_stock_thresholds(directory.get(selected_branch_id))
         low_stock_items = [
             {
                 "Item": item_key.replace('_', ' ').title(),
-                "Stock": stock,
-                "Threshold": low_stock_threshold.get(item_key, 50)
+                "Stock": branch_inventory[item_key],
+                "Threshold": threshold_for(thresholds, item_key)
             }
-            for item_key, stock in branch_inventory.items()
-            if stock < low_stock_threshold.get(item_key, 50)
+            for item_key in find_low_stock(branch_inventory, thresholds)
         ]
 
         if low_stock_items:
@@ -1,32 +1,52 @@
 # order.py
 import streamlit as st
-import stripe
 
-from firebase_init import db
 from menu import menu
-from utils import validate_branch_inventory, save_order_to_firestore, create_checkout_session
+from branch_directory import get_branch_directory
+from promotion_index import find_coupon, get_promotion_index
+from thumbnails import get_thumbnail
+from branch_inventory import InsufficientInventoryError, last_known_inventory
+from recipe_matrix import max_makeable
+from stripe_catalog import get_stripe_catalog
+from order_service import build_order, cart_totals
+from order_outbox import FAILED, REJECTED, get_order_outbox, new_order_id
+from utils import create_checkout_session
 import datetime
-import os
-from PIL import Image
 import webbrowser
 
+# Drinks with this many or fewer left get a "limited" badge
+LIMITED_STOCK_BADGE = 5
+
+# Where Stripe Checkout sends the customer back to
+CHECKOUT_RETURN_URL = "https://appcoffeeapp-7bmxg7hufgmtyg2iwwfycr.streamlit.app/"
+
 def customer_order():
     st.title("Order")
 
-    # Fetch branch data from Firestore
-    branches_ref = db.collection("branches").stream()
-    branches = [{"Branch Name": b.to_dict()["cafe_name"], "Branch ID": b.id} for b in branches_ref]
+    # Fetch branch data from the shared branch directory
+    directory = get_branch_directory()
+    branch_names = directory.names()
+
+    # Start syncing the Stripe prices in the background before anyone checks out
+    get_stripe_catalog()
 
-    if not branches:
+    if not branch_names:
         st.warning("No branches available. Please contact admin.")
     else:
         # Branch selection
         with st.container(border=True):
             st.subheader("Select Branch")
-            branch_names = [branch["Branch Name"] for branch in branches]
             selected_branch_name = st.selectbox("Select Branch to Order From", branch_names)
-            selected_branch = next(branch for branch in branches if branch["Branch Name"] == selected_branch_name)
-            selected_branch_id = selected_branch["Branch ID"]
+            selected_branch_id = directory.id_for(selected_branch_name)
+
+        # How many of each drink the branch can still make, after the cart and orders not yet committed.
+        # During an outage the last stock seen is used; with none seen yet, no stock badges are shown
+        branch_cart = [item for item in st.session_state.get("cart", []) if item["branch_id"] == selected_branch_id]
+        reserved = branch_cart + get_order_outbox().queued_items(selected_branch_id)
+        try:
+            availability = max_makeable(last_known_inventory(selected_branch_id) or {}, reserved)
+        except Exception:
+            availability = None
 
         # Initialize session state for quantity reset
         if "reset_quantity" not in st.session_state:
@@ -42,17 +62,22 @@ def customer_order():
             cols = st.columns(cols_per_row)
             for idx, (coffee, details) in enumerate(menu_items[i:i + cols_per_row]):
                 with cols[idx]:
-                    # Display coffee image
-                    if os.path.exists(details["image_path"]):
-                        image = Image.open(details["image_path"])
-                        resized_image = image.resize((300, 200))  # Resize to a consistent size
-                        st.image(resized_image, use_container_width=True)
+                    # Display coffee image from the pre-rendered thumbnail cache
+                    thumbnail = get_thumbnail(details["image_path"])
+                    if thumbnail is not None:
+                        st.image(thumbnail, use_container_width=True)
                     else:
                         st.error(f"Image not found for {coffee}. Please check the file path.")
 
                     # Display coffee details
                     st.markdown(f"### {coffee}")
                     st.markdown(f"**Price:** RM{details['price']:.2f}")
+                    available = availability.get(coffee, 0) if availability is not None else None  # None: unknown
+                    if available is not None:
+                        if available <= 0:
+                            st.markdown(":red-background[Sold out]")
+                        elif available <= LIMITED_STOCK_BADGE:
+                            st.markdown(f":orange-background[Only {available} left]")
                     st.write(details["description"])
 
                     # Quantity input and "Add to Cart" button
@@ -63,8 +88,10 @@ def customer_order():
                         key=f"qty_{coffee}",
                         value=0 if st.session_state["reset_quantity"] else None,
                     )
-                    if st.button(f"Add {coffee} to Cart", key=f"add_{coffee}"):
-                        if quantity > 0:
+                    if st.button(f"Add {coffee} to Cart", key=f"add_{coffee}", disabled=available is not None and available <= 0):
+                        if quantity and available is not None and quantity > available:
+                            st.error(f"Only {available}x {coffee} can be made at {selected_branch_name} right now.")
+                        elif quantity > 0:
                             if "cart" not in st.session_state:
                                 st.session_state["cart"] = []
                             # Update cart to combine items with the same coffee and branch
@@ -95,9 +122,10 @@ def customer_order():
             with st.container(border=True):
                 st.subheader("Cart")
                 cart_items = st.session_state["cart"]
+                branch_names = directory.names_for(item["branch_id"] for item in cart_items)
                 for idx, item in enumerate(cart_items):
-                    branch = next(branch for branch in branches if branch["Branch ID"] == item["branch_id"])
-                    st.write(f"{item['quantity']}x {item['coffee']} (Branch: {branch['Branch Name']})")
+                    branch_name = branch_names[item["branch_id"]]
+                    st.write(f"{item['quantity']}x {item['coffee']} (Branch: {branch_name})")
                     if st.button(f"Remove", key=f"remove_{idx}"):
                         st.session_state["cart"].pop(idx)
                         st.rerun()
@@ -107,10 +135,7 @@ def customer_order():
                 st.subheader("Apply Coupon or Voucher")
                 coupon_code = st.text_input("Enter Coupon Code")
                 if st.button("Validate Coupon"):
-                    promo_docs = db.collection("promotions").where("type", "==", "Coupon").stream()
-                    matching_coupon = next(
-                        (doc.to_dict() for doc in promo_docs if doc.to_dict().get("coupon_code") == coupon_code), None
-                    )
+                    matching_coupon = find_coupon(coupon_code)
                     if matching_coupon:
                         expiration_date = datetime.datetime.strptime(matching_coupon["expiration_date"], "%Y-%m-%d").date()
                         if expiration_date >= datetime.date.today():
@@ -121,15 +146,9 @@ def customer_order():
                     else:
                         st.error("Invalid coupon code.")
 
-            # Fetch applicable promotions
+            # Look up applicable promotions in the shared in-memory promotion index
             cart_coffees = [item["coffee"] for item in st.session_state["cart"]]
-            promotions_ref = db.collection("promotions").where("type", "==", "Promotion").stream()
-
-            # Convert Firestore documents to dictionaries
-            applicable_promotions = [
-                promo.to_dict() for promo in promotions_ref
-                if any(coffee in promo.to_dict().get("included_coffees", []) for coffee in cart_coffees)
-            ]
+            applicable_promotions = get_promotion_index().applicable(cart_coffees)
 
             # Display applicable promotions
             if applicable_promotions:
@@ -145,89 +164,62 @@ def customer_order():
             # Final price and checkout
             with st.container(border=True):
                 st.subheader("Final Price and Checkout")
-                total_price = sum(
-                    menu[item["coffee"]]["price"] * item["quantity"] for item in st.session_state["cart"]
-                )
-                applied_discount = 0
-
-                # Apply promotion discount
-                if "applied_promotion" in st.session_state and st.session_state["applied_promotion"]:
-                    promo = st.session_state["applied_promotion"]
-                    if "included_coffees" in promo:  # Ensure promo is valid
-                        for item in st.session_state["cart"]:
-                            if item["coffee"] in promo["included_coffees"]:
-                                applied_discount += (
-                                    menu[item["coffee"]]["price"] * item["quantity"] * promo["discount"] / 100
-                                )
-
-                # Apply coupon discount
-                if "applied_coupon" in st.session_state and st.session_state["applied_coupon"]:
-                    coupon = st.session_state["applied_coupon"]
-                    if "included_coffees" in coupon:  # Ensure coupon is valid
-                        for item in st.session_state["cart"]:
-                            if item["coffee"] in coupon["included_coffees"]:
-                                applied_discount += (
-                                    menu[item["coffee"]]["price"] * item["quantity"] * coupon["discount"] / 100
-                                )
-
-                total_price -= applied_discount
-                total_price = max(total_price, 0)  # Ensure total is not negative
+                # Percentage off per coffee from the applied promotion and coupon
+                discounts = {}
+                for key in ("applied_promotion", "applied_coupon"):
+                    offer = st.session_state.get(key)
+                    if offer and "included_coffees" in offer:  # Ensure the offer is valid
+                        for coffee in offer["included_coffees"]:
+                            discounts[coffee] = discounts.get(coffee, 0) + offer["discount"]
+
+                total_price = cart_totals(st.session_state["cart"], discounts)["total_price"]
                 st.write(f"**Total Price (after discount): RM{total_price:.2f}**")
 
                 if st.button("Checkout"):
                     cart = st.session_state.get("cart", [])
                     if cart:
-                        if validate_branch_inventory(cart, selected_branch_id):
-                            # Save order to Firestore and get the order ID
-                            order_ref = db.collection("orders").add({
-                                "branch_id": selected_branch_id,
-                                "customer": st.session_state.get("authenticated_user", "guest"),
-                                "items": cart,
-                                "total_cost": total_price,
-                                "order_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                "prepared_time": None,
-                            })
-                            order_id = order_ref[1].id  # Get the generated order ID from Firestore
+                        try:
+                            # Queue the order durably; the outbox commits it, its stock deduction and sales rollup
+                            # in the background. The ID is kept until checkout succeeds, so a double click queues it once
+                            customer = st.session_state.get("authenticated_user", "guest")
+                            order_id = st.session_state.setdefault("checkout_order_id", new_order_id())
+                            outbox = get_order_outbox()
+                            outbox.enqueue(build_order(cart, customer, selected_branch_id, discounts), order_id)
+                        except InsufficientInventoryError as e:
+                            st.error(str(e))
+                            order_id = None
+                        if order_id:
+                            # Not committed yet: Pickup Notification and Order History report how it turns out
                             st.session_state["checkout_message"] = (
-                                f"Order placed successfully from {selected_branch_name} with Order ID: {order_id}!"
+                                f"Order received from {selected_branch_name} with Order ID: {order_id}! "
+                                "Follow it in Pickup Notification; if it can't be fulfilled, your payment is cancelled."
                             )
                             st.success(st.session_state["checkout_message"], icon="🎉")
 
                             try:
-                                # Create Stripe price object
-                                stripe_price = stripe.Price.create(
-                                    currency="myr",
-                                    unit_amount=int(total_price * 100),  # Convert to cents
-                                    product_data={"name": "Coffee Order"},
-                                )
-
-                                # Create Stripe checkout session
-                                session = stripe.checkout.Session.create(
-                                    line_items=[
-                                        {"price": stripe_price['id'], "quantity": 1}
-                                    ],
-                                    mode="payment",
-                                    success_url="https://appcoffeeapp-7bmxg7hufgmtyg2iwwfycr.streamlit.app/",
-                                    cancel_url="https://appcoffeeapp-7bmxg7hufgmtyg2iwwfycr.streamlit.app/",
-                                )
-
-                                # Open the checkout session URL
-                                webbrowser.open(session.url, new=0)
-
-                                # Retrieve the session and display payment status
-                                st.write("Redirecting to payment gateway...")
-                                payment_session = stripe.checkout.Session.retrieve(session.id)
-                                st.write(f"Payment Status: {payment_session.payment_status}")
+                                # One Stripe call: line items use the cached per-item prices
+                                session = create_checkout_session(cart, CHECKOUT_RETURN_URL, discounts, order_id)
+
+                                # A session for an order rejected meanwhile is expired by the flusher instead of paid
+                                if outbox.attach_checkout_session(order_id, session.id) in (REJECTED, FAILED):
+                                    st.error("Your order could not be placed, so no payment will be taken.")
+                                else:
+                                    # Open the checkout session URL
+                                    webbrowser.open(session.url, new=0)
+                                    st.write("Redirecting to payment gateway...")
                             except Exception as e:
                                 st.error(f"Stripe checkout session failed: {str(e)}")
 
+                            # Session caches of order history and today's pickups no longer include this order
+                            st.session_state.pop("checkout_order_id", None)
+                            st.session_state.pop("order_history_pages", None)
+                            st.session_state.pop("pickup_orders", None)
+
                             # Clear cart and set reset_quantity flag
                             st.session_state["cart"] = []
                             st.session_state["applied_promotion"] = None
                             st.session_state["applied_coupon"] = None
                             st.session_state["reset_quantity"] = True
                             st.rerun()
-                        else:
-                            st.error("Insufficient inventory at the selected branch to fulfill the order.")
                     else:
                         st.error("Your cart is empty. Add items to proceed with checkout.")
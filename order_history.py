@@ -1,67 +1,129 @@
 # order_history.py
 import streamlit as st
-from firebase_init import db
-from menu import menu  # Import the menu to access coffee prices
+from firebase_init import db, Query
+from menu import line_amounts
+from branch_directory import get_branch_directory
+from order_times import day_bounds, format_order_time, to_datetime
+from order_outbox import get_order_outbox, show_outbox_status
+
+# Number of orders fetched per "Load more" click
+PAGE_SIZE = 10
+
+
+def _history_query(customer, branch_id, date_range):
+    # Filters run in Firestore; newest orders first
+    orders_query = db.collection("orders").where("customer", "==", customer)
+    if branch_id:
+        orders_query = orders_query.where("branch_id", "==", branch_id)
+    if date_range:
+        start, end = day_bounds(date_range[0], date_range[-1])
+        orders_query = orders_query.where("order_time", ">=", start).where("order_time", "<", end)
+    return orders_query.order_by("order_time", direction=Query.DESCENDING)
+
+
+def _load_next_page(history, orders_query):
+    # Fetch one extra document to know whether another page exists
+    if history["cursor"] is not None:
+        orders_query = orders_query.start_after(history["cursor"])
+    snapshots = orders_query.limit(PAGE_SIZE + 1).get()
+    page = snapshots[:PAGE_SIZE]
+    history["orders"].extend({"Order ID": o.id, **o.to_dict()} for o in page)
+    history["cursor"] = page[-1] if page else history["cursor"]
+    history["has_more"] = len(snapshots) > PAGE_SIZE
+
+
+def _outbox_orders(customer, branch_id, date_range):
+    # Orders still being confirmed, or turned down, live only in the outbox; filtered the same way
+    start, end = day_bounds(date_range[0], date_range[-1]) if date_range else (None, None)
+    return [
+        {"Order ID": order_id, **order}
+        for order_id, order in get_order_outbox().queued_orders(customer).items()
+        if (not branch_id or order["branch_id"] == branch_id)
+        and (not date_range or start <= to_datetime(order["order_time"]) < end)
+    ]
+
+
+def _show_order(order, branch_name):
+    st.write(f"**Order ID:** {order['Order ID']}")
+
+    st.write(f"**Branch:** {branch_name}")
+
+    # Display all items in the order
+    st.write("**Items:**")
+    for item in order["items"]:
+        coffee_name = item["coffee"]
+        quantity = item["quantity"]
+        # The price charged is stored on the line, so menu changes do not rewrite history
+        total_item_price, _ = line_amounts(item)
+        discount = item.get("discount", 0)
+        suffix = f" ({discount:g}% off)" if discount else ""
+        st.write(f"{quantity}x {coffee_name} - RM{total_item_price:.2f}{suffix}")
+
+    # Display total price of the order
+    st.write(f"**Total Quantity:** {order.get('total_quantity', 0)}")
+    st.write(f"**Total Price:** RM{order.get('total_price', 0.00):.2f}")
 
 
 def order_history():
     st.title("Order History")
+    directory = get_branch_directory()  # Shared branch names, no per-order database calls
 
-    # Fetch customer's orders
-    orders_ref = db.collection("orders").where("customer", "==", st.session_state["authenticated_user"]).stream()
-    customer_orders = [
-        {"Order ID": o.id, **o.to_dict()}
-        for o in orders_ref
-    ]
+    # Server-side filters for branch and date range
+    with st.container(border=True):
+        st.subheader("Filter Orders")
+        branch_options = ["All Branches"] + directory.names()
+        selected_branch_name = st.selectbox("Branch", branch_options)
+        selected_branch_id = None if selected_branch_name == "All Branches" else directory.id_for(selected_branch_name)
+        date_range = st.date_input("Order Date Range", value=[])
+
+    customer = st.session_state["authenticated_user"]
+    outbox_orders = _outbox_orders(customer, selected_branch_id, tuple(date_range))
+    outbox_ids = {order["Order ID"] for order in outbox_orders}
+
+    # Keep the loaded pages and cursor across reruns until the filters change, or until an order
+    # shown from the outbox last time has been committed (the loaded pages were read without it)
+    filters = (customer, selected_branch_id, tuple(date_range))
+    history = st.session_state.get("order_history_pages")
+    if not history or history["filters"] != filters or history["outbox_ids"] - outbox_ids:
+        history = {"filters": filters, "orders": [], "cursor": None, "has_more": True}
+        st.session_state["order_history_pages"] = history
+    history["outbox_ids"] = outbox_ids
 
-    # Sort orders by order_time in descending order
-    # Added: Sorting customer_orders based on 'order_time'
-    customer_orders.sort(key=lambda x: x.get("order_time", ""), reverse=True)
+    orders_query = _history_query(customer, selected_branch_id, tuple(date_range))
+    if not history["orders"] and history["has_more"]:
+        _load_next_page(history, orders_query)
+
+    customer_orders = history["orders"]
+
+    # Resolve every branch on the page at once
+    branch_names = directory.names_for(order.get("branch_id", "N/A") for order in customer_orders + outbox_orders)
+
+    if outbox_orders:
+        st.subheader("Recent Orders")
+        for order in outbox_orders:
+            with st.container(border=True):
+                _show_order(order, branch_names[order.get("branch_id", "N/A")])
+                st.write(f"**Order Placed At:** {format_order_time(order['order_time'])}")
+                show_outbox_status(order)
 
     if customer_orders:
         st.subheader("Your Order History")
-        branch_cache = {}  # Cache to store branch names to avoid multiple database calls
 
         for order in customer_orders:
             # Create a container with a border for each order
             with st.container(border=True):
-                st.write(f"**Order ID:** {order['Order ID']}")
-
-                # Get the branch ID from the order
-                branch_id = order.get("branch_id", "N/A")
-                if branch_id != "N/A":
-                    # Check if the branch name is already in the cache
-                    if branch_id in branch_cache:
-                        branch_name = branch_cache[branch_id]
-                    else:
-                        # Fetch the branch document from Firestore
-                        branch_doc = db.collection("branches").document(branch_id).get()
-                        if branch_doc.exists:
-                            branch_name = branch_doc.to_dict().get("cafe_name", "Unknown Branch")
-                            # Store the branch name in the cache
-                            branch_cache[branch_id] = branch_name
-                        else:
-                            branch_name = "Unknown Branch"
-                else:
-                    branch_name = "N/A"
-
-                st.write(f"**Branch:** {branch_name}")
-
-                # Display all items in the order
-                st.write("**Items:**")
-                for item in order["items"]:
-                    coffee_name = item["coffee"]
-                    quantity = item["quantity"]
-                    # Calculate the price per item
-                    price_per_item = menu[coffee_name]["price"]
-                    total_item_price = price_per_item * quantity
-                    st.write(f"{quantity}x {coffee_name} - RM{total_item_price:.2f}")
-
-                # Display total price of the order
-                st.write(f"**Total Quantity:** {order.get('total_quantity', 0)}")
-                st.write(f"**Total Price:** RM{order.get('total_price', 0.00):.2f}")
-                st.write(f"**Order Placed At:** {order['order_time']}")
+                _show_order(order, branch_names[order.get("branch_id", "N/A")])
+                st.write(f"**Payment Status:** {order.get('payment_status', 'unknown').replace('_', ' ').title()}")
+                st.write(f"**Order Placed At:** {format_order_time(order['order_time'])}")
 
                 # No need for a separator line as the container provides visual separation
-    else:
+
+        # Fetch the next page only when asked
+        if history["has_more"]:
+            if st.button("Load more"):
+                _load_next_page(history, orders_query)
+                st.rerun()
+        else:
+            st.caption(f"Showing all {len(customer_orders)} order(s).")
+    elif not outbox_orders:
         st.warning("You have no previous orders.")
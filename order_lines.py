@@ -0,0 +1,69 @@
+# order_lines.py
+import numpy as np
+import pandas as pd
+
+from menu import menu
+from order_times import to_local_series
+
+ORDER_LINE_COLUMNS = [
+    "order_id", "branch_id", "customer", "order_time", "coffee",
+    "quantity", "unit_price", "unit_cost", "discount", "price", "cost",
+]
+
+
+def menu_table():
+    # Menu prices and costs as a frame indexed by coffee name, for vectorized joins
+    return pd.DataFrame(
+        {"unit_price": [d["price"] for d in menu.values()], "unit_cost": [d["cost"] for d in menu.values()]},
+        index=pd.Index(list(menu.keys()), name="coffee"),
+    )
+
+
+def build_order_lines(order_docs):
+    """Flatten order documents into a columnar DataFrame with one row per order line.
+
+    ``order_docs`` is any iterable of Firestore document snapshots. Text columns
+    are categorical, ``order_time`` is naive local datetime64 and ``price``/``cost`` are the
+    line totals (after discounts) from the prices snapshotted on each line.
+    """
+    order_ids, branch_ids, customers, order_times, coffees, quantities = [], [], [], [], [], []
+    unit_prices, unit_costs, discounts = [], [], []
+    for o in order_docs:
+        order_data = o.to_dict()
+        items = order_data.get("items") or []
+        n = len(items)
+        if not n:
+            continue
+        order_ids.extend([o.id] * n)
+        branch_ids.extend([order_data.get("branch_id")] * n)
+        customers.extend([order_data.get("customer", "Unknown")] * n)
+        order_times.extend([order_data.get("order_time")] * n)
+        for item in items:
+            coffees.append(item["coffee"])
+            quantities.append(item["quantity"])
+            unit_prices.append(item.get("unit_price", np.nan))
+            unit_costs.append(item.get("unit_cost", np.nan))
+            discounts.append(item.get("discount", 0))
+
+    lines = pd.DataFrame({
+        "order_id": order_ids,
+        "branch_id": pd.Categorical(branch_ids),
+        "customer": pd.Categorical(customers),
+        "order_time": to_local_series(order_times),
+        "coffee": pd.Categorical(coffees),
+        "quantity": np.asarray(quantities, dtype=np.int32),
+        "unit_price": np.asarray(unit_prices, dtype=float),
+        "unit_cost": np.asarray(unit_costs, dtype=float),
+        "discount": np.asarray(discounts, dtype=float),
+    })
+
+    missing = lines["unit_price"].isna().to_numpy()
+    if missing.any():
+        # Lines saved before prices were snapshotted: one join on the menu until they are backfilled
+        prices = menu_table().reindex(lines["coffee"].cat.categories).fillna(0.0)
+        codes = lines["coffee"].cat.codes.to_numpy()[missing]
+        lines.loc[missing, "unit_price"] = prices["unit_price"].to_numpy()[codes]
+        lines.loc[missing, "unit_cost"] = prices["unit_cost"].to_numpy()[codes]
+    lines["price"] = lines["unit_price"] * lines["quantity"] * (100 - lines["discount"]) / 100
+    lines["cost"] = lines["unit_cost"] * lines["quantity"]
+    return lines[ORDER_LINE_COLUMNS]
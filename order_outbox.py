@@ -0,0 +1,360 @@
+# order_outbox.py
+"""Durable write-behind queue for placed orders.
+
+Checkout appends the order to a local SQLite outbox (WAL mode) and returns
+at once; a background flusher commits queued orders, their inventory
+deductions and sales rollups to Firestore in batched writes. Every order is
+keyed by a client-generated ID, so a replayed order is never written or
+deducted twice, and orders placed while Firestore is unreachable are kept
+until it is back (including across restarts). Orders the flusher rejects or
+gives up on stay in the outbox, so the customer still sees them, and their
+Stripe Checkout session is expired (or refunded once paid).
+
+Importing this module is cheap: the stock check and the commit path (and
+with them pandas and NumPy) are only imported when first used.
+"""
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+import datetime_json
+from firebase_init import BACKEND, db
+
+logger = logging.getLogger(__name__)
+
+# The in-memory backend loses its data on restart anyway, so its outbox does too
+OUTBOX_PATH = os.environ.get(
+    "COFFEE_APP_OUTBOX_PATH", ":memory:" if BACKEND == "memory" else "order_outbox.sqlite3"
+)
+
+# Queued orders committed per flush pass
+FLUSH_LIMIT = 450
+
+# Seconds the flusher sleeps when nothing wakes it
+FLUSH_INTERVAL = 5
+
+# Longest pause between retries while Firestore keeps failing
+MAX_RETRY_DELAY = 60
+
+# Attempts after which an order that keeps failing is set aside instead of blocking the queue
+MAX_ATTEMPTS = 20
+
+PENDING = "pending"
+REJECTED = "rejected"  # The branch could not fulfil the order
+FAILED = "failed"  # Gave up after MAX_ATTEMPTS
+
+
+def new_order_id():
+    """Return a fresh order ID; generated locally, without a round trip."""
+    return db.collection("orders").document().id
+
+
+class OrderOutbox:
+    """SQLite-backed queue of orders waiting to be committed to Firestore."""
+
+    def __init__(self, path=OUTBOX_PATH):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS order_outbox ("
+            " order_id TEXT PRIMARY KEY, branch_id TEXT NOT NULL, customer TEXT, payload TEXT NOT NULL,"
+            " enqueued_at REAL NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT,"
+            " checkout_session_id TEXT, payment_cancelled TEXT)"
+        )
+        # Outboxes created before payments were tracked lack the last two columns
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(order_outbox)")}
+        for column in ("checkout_session_id", "payment_cancelled"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE order_outbox ADD COLUMN {column} TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS order_outbox_status ON order_outbox (status, enqueued_at)")
+        self._conn.commit()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+
+    def enqueue(self, order, order_id=None):
+        """Durably queue ``order`` and return its ID without waiting for Firestore.
+
+        Re-enqueueing the same ``order_id`` (a double-clicked checkout) keeps
+        the first order. Raises ``InsufficientInventoryError`` when the
+        branch's cached stock, less the orders still queued for it, cannot
+        cover the order, or when no stock level for the branch is known.
+        """
+        order_id = order_id or new_order_id()
+        if self._query("SELECT 1 FROM order_outbox WHERE order_id = ?", (order_id,)):
+            return order_id
+        self._check_stock(order)
+        self._execute(
+            "INSERT OR IGNORE INTO order_outbox (order_id, branch_id, customer, payload, enqueued_at, status)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (order_id, order["branch_id"], order.get("customer"), datetime_json.dumps(order), time.time(), PENDING),
+        )
+        self._wake.set()
+        return order_id
+
+    def _check_stock(self, order):
+        from branch_inventory import InsufficientInventoryError, find_inventory_shortfall, last_known_inventory
+
+        branch_id = order["branch_id"]
+        try:
+            # While Firestore is unreachable this checks against the last stock seen; the flusher re-checks
+            inventory = last_known_inventory(branch_id)
+        except Exception:
+            # Nothing seen yet, so the order could not be promised; refuse it rather than queue it blind
+            raise InsufficientInventoryError(
+                "Stock at this branch can't be checked right now. Please try again shortly."
+            ) from None
+        if inventory is None:
+            raise InsufficientInventoryError(f"Branch with ID '{branch_id}' not found.")
+        shortfall = find_inventory_shortfall(self.queued_items(branch_id) + order["items"], inventory)
+        if shortfall:
+            raise InsufficientInventoryError(shortfall)
+
+    def _orders(self, sql, params=()):
+        return [(order_id, datetime_json.loads(payload)) for order_id, payload in self._query(sql, params)]
+
+    def queued_items(self, branch_id):
+        """Return the cart items of orders still queued for a branch."""
+        orders = self._orders("SELECT order_id, payload FROM order_outbox WHERE status = ? AND branch_id = ?", (PENDING, branch_id))
+        return [item for _, order in orders for item in order["items"]]
+
+    def queued_orders(self, customer):
+        """Return ``{order_id: order}`` for a customer's orders not in Firestore, newest first.
+
+        Each order carries its ``outbox_status``, ``outbox_error`` and
+        ``payment_cancelled`` (how its payment was stopped, if it was).
+        """
+        rows = self._query(
+            "SELECT order_id, payload, status, last_error, payment_cancelled FROM order_outbox"
+            " WHERE customer = ? ORDER BY enqueued_at DESC", (customer,)
+        )
+        return {
+            order_id: {
+                **datetime_json.loads(payload),
+                "outbox_status": status, "outbox_error": last_error, "payment_cancelled": payment_cancelled,
+            }
+            for order_id, payload, status, last_error, payment_cancelled in rows
+        }
+
+    def statuses(self, order_ids):
+        """Return ``{order_id: (status, last_error, payment_cancelled)}`` for those of ``order_ids`` still in the outbox."""
+        order_ids = list(order_ids)
+        if not order_ids:
+            return {}
+        rows = self._query(
+            "SELECT order_id, status, last_error, payment_cancelled FROM order_outbox"
+            f" WHERE order_id IN ({','.join('?' * len(order_ids))})", order_ids,
+        )
+        return {order_id: (status, last_error, payment_cancelled) for order_id, status, last_error, payment_cancelled in rows}
+
+    def attach_checkout_session(self, order_id, session_id):
+        """Record the Stripe Checkout session paying for a queued order and return the order's status.
+
+        If the order was already rejected or set aside, the flusher is woken
+        to expire the session.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE order_outbox SET checkout_session_id = ? WHERE order_id = ?", (session_id, order_id))
+            row = self._conn.execute("SELECT status FROM order_outbox WHERE order_id = ?", (order_id,)).fetchone()
+        status = row[0] if row else None
+        if status in (REJECTED, FAILED):
+            self._wake.set()
+        return status
+
+    def cancel_payments(self):
+        """Expire, or refund if already paid, the checkout sessions of rejected and failed orders.
+
+        Returns how many sessions were handled; a Stripe error is raised and
+        the remaining sessions are retried on the next call.
+        """
+        rows = self._query(
+            "SELECT order_id, checkout_session_id FROM order_outbox"
+            " WHERE status != ? AND checkout_session_id IS NOT NULL AND payment_cancelled IS NULL", (PENDING,)
+        )
+        if not rows:
+            return 0
+        from utils import cancel_checkout_session
+
+        for order_id, session_id in rows:
+            outcome = cancel_checkout_session(session_id)
+            self._execute("UPDATE order_outbox SET payment_cancelled = ? WHERE order_id = ?", (outcome, order_id))
+            logger.warning("Checkout session %s of order %s: %s", session_id, order_id, outcome)
+        return len(rows)
+
+    def stats(self):
+        """Return the number of orders per status and the age of the oldest pending one."""
+        counts = {PENDING: 0, REJECTED: 0, FAILED: 0}
+        for status, count in self._query("SELECT status, COUNT(*) FROM order_outbox GROUP BY status"):
+            counts[status] = count
+        oldest = self._query("SELECT MIN(enqueued_at) FROM order_outbox WHERE status = ?", (PENDING,))[0][0]
+        counts["oldest_pending_seconds"] = round(time.time() - oldest, 1) if oldest else 0
+        return counts
+
+    def problems(self):
+        """Return the rejected and failed orders with their last error, newest first."""
+        rows = self._query(
+            "SELECT order_id, branch_id, customer, status, attempts, last_error, payment_cancelled, enqueued_at"
+            " FROM order_outbox WHERE status != ? ORDER BY enqueued_at DESC", (PENDING,)
+        )
+        return [
+            {
+                "Order ID": order_id, "Branch ID": branch_id, "Customer": customer, "Status": status,
+                "Attempts": attempts, "Error": last_error, "Payment": payment_cancelled,
+                "Queued At": datetime.datetime.fromtimestamp(enqueued_at).strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            for order_id, branch_id, customer, status, attempts, last_error, payment_cancelled, enqueued_at in rows
+        ]
+
+    def _settle(self, committed, rejected):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM order_outbox WHERE order_id = ?", [(order_id,) for order_id in committed])
+            self._conn.executemany(
+                "UPDATE order_outbox SET status = ?, last_error = ? WHERE order_id = ?",
+                [(REJECTED, error, order_id) for order_id, error in rejected.items()],
+            )
+
+    def _note_failure(self, order_id, error):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE order_outbox SET attempts = attempts + 1, last_error = ?,"
+                " status = CASE WHEN attempts + 1 >= ? THEN ? ELSE status END WHERE order_id = ?",
+                (str(error), MAX_ATTEMPTS, FAILED, order_id),
+            )
+
+    def flush(self, limit=FLUSH_LIMIT):
+        """Commit up to ``limit`` queued orders, oldest first; returns how many left the queue.
+
+        Orders go out in as few batched writes as possible. If a batch fails,
+        the orders are retried one at a time (replays are idempotent) and
+        the pass stops at the first order that still fails, re-raising its
+        error so the caller can back off.
+        """
+        with self._flush_lock:
+            orders = self._orders(
+                "SELECT order_id, payload FROM order_outbox WHERE status = ? ORDER BY enqueued_at LIMIT ?", (PENDING, limit)
+            )
+            if not orders:
+                return 0
+            from branch_inventory import InsufficientInventoryError
+            from order_service import commit_order, commit_orders
+
+            try:
+                rejected = commit_orders(orders)
+                committed = [order_id for order_id, _ in orders if order_id not in rejected]
+            except Exception:
+                logger.warning("Batched flush of %d order(s) failed; retrying one at a time", len(orders), exc_info=True)
+                committed, rejected = [], {}
+                for order_id, order in orders:
+                    try:
+                        commit_order(order, order_id)
+                        committed.append(order_id)
+                    except InsufficientInventoryError as e:
+                        rejected[order_id] = str(e)
+                    except Exception as e:
+                        self._settle(committed, rejected)
+                        self._note_failure(order_id, e)
+                        raise
+            self._settle(committed, rejected)
+            for order_id, error in rejected.items():
+                logger.error("Queued order %s was rejected: %s", order_id, error)
+            return len(committed) + len(rejected)
+
+    def wait_for_work(self, timeout):
+        woken = self._wake.wait(timeout)
+        self._wake.clear()
+        return woken
+
+    def wake(self):
+        self._wake.set()
+
+
+class OutboxFlusher(threading.Thread):
+    """Daemon thread that commits queued orders, backing off while Firestore is failing.
+
+    After each pass it also stops payment for orders that were rejected or set aside.
+    """
+
+    def __init__(self, outbox, interval=FLUSH_INTERVAL):
+        super().__init__(name="order-outbox-flusher", daemon=True)
+        self._outbox = outbox
+        self._interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        delay = 0
+        while not self._stop_event.is_set():
+            try:
+                # Keep going while full passes suggest more is queued
+                while self._outbox.flush() >= FLUSH_LIMIT:
+                    pass
+                delay = 0
+            except Exception:
+                logger.exception("Flushing queued orders failed")
+                delay = min(delay * 2 or 1, MAX_RETRY_DELAY)
+            try:
+                self._outbox.cancel_payments()
+            except Exception:
+                logger.exception("Cancelling payment for rejected orders failed")
+            if delay:
+                self._stop_event.wait(delay)
+            else:
+                self._outbox.wait_for_work(self._interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self._outbox.wake()
+
+
+@st.cache_resource
+def get_order_outbox():
+    # One outbox and flusher per server process; orders left from a previous run are flushed on start
+    outbox = OrderOutbox()
+    OutboxFlusher(outbox).start()
+    return outbox
+
+
+def show_outbox_status(order):
+    """Show the status of an order from ``OrderOutbox.queued_orders`` to its customer."""
+    status = order["outbox_status"]
+    if status == PENDING:
+        st.info("**Status:** Received, being confirmed. This usually takes a few seconds.")
+        return
+    reason = order.get("outbox_error") or "it could not be committed"
+    payment = {
+        "expired": "The payment was cancelled.",
+        "refunded": "Your payment has been refunded.",
+    }.get(order.get("payment_cancelled"), "You will not be charged for it.")
+    if status == REJECTED:
+        st.error(f"**Status:** Not placed: {reason} {payment}")
+    else:
+        st.error(f"**Status:** Not placed; please contact the branch. {payment}")
+
+
+def order_outbox_report():
+    """Show orders still queued for Firestore and any the flusher had to set aside."""
+    outbox = get_order_outbox()
+    stats = outbox.stats()
+    if not (stats[PENDING] or stats[REJECTED] or stats[FAILED]):
+        return
+    with st.sidebar.expander("Order Outbox"):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Queued", stats[PENDING])
+        col2.metric("Rejected", stats[REJECTED])
+        col3.metric("Failed", stats[FAILED])
+        if stats[PENDING]:
+            st.caption(f"Oldest queued order is {stats['oldest_pending_seconds']}s old.")
+        problems = outbox.problems()
+        if problems:
+            st.dataframe(problems, hide_index=True)
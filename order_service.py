@@ -0,0 +1,256 @@
+# order_service.py
+from firebase_init import commit_in_batches, db, transactional
+from menu import menu
+from branch_inventory import (
+    InsufficientInventoryError,
+    deduct_inventory,
+    invalidate_inventory_cache,
+    note_inventory_deducted,
+    plan_inventory_deduction,
+    stage_inventory_deduction,
+    update_low_stock_flag,
+)
+from sales_rollups import record_order
+import order_times
+
+# Orders per WriteBatch when committing queued orders; each takes up to three of its 500 writes
+ORDERS_PER_BATCH = 150
+
+
+def order_line(item, discounts=None):
+    """Return a cart item as an order line, with the prices it is charged at.
+
+    The unit price, unit cost and percentage off are snapshotted onto the
+    line, together with the line totals (``price`` after the discount, and
+    ``cost``), so reports never look prices up in the live menu again.
+    """
+    details = menu[item["coffee"]]
+    quantity = item["quantity"]
+    discount = min((discounts or {}).get(item["coffee"], 0), 100)
+    return {
+        "coffee": item["coffee"],
+        "quantity": quantity,
+        "unit_price": details["price"],
+        "unit_cost": details["cost"],
+        "discount": discount,
+        "price": details["price"] * quantity * (100 - discount) / 100,
+        "cost": details["cost"] * quantity,
+    }
+
+
+def cart_totals(cart, discounts=None):
+    """Return the quantity, discount, price and cost totals for a cart.
+
+    ``discounts`` maps a coffee to its percentage off (promotions and coupons
+    combined). ``total_price`` is the amount charged, after discounts.
+    """
+    lines = [order_line(item, discounts) for item in cart]
+    subtotal = sum(line["unit_price"] * line["quantity"] for line in lines)
+    total_price = sum(line["price"] for line in lines)
+    return {
+        "total_quantity": sum(line["quantity"] for line in lines),
+        "subtotal": subtotal,
+        "discount": subtotal - total_price,
+        "total_price": total_price,
+        "total_cost": sum(line["cost"] for line in lines),
+    }
+
+
+def build_order(cart, customer, branch_id, discounts=None):
+    """Return the order document for a cart, in the schema every order uses."""
+    totals = cart_totals(cart, discounts)
+    return {
+        "customer": customer,
+        "branch_id": branch_id,
+        "items": [{**order_line(item, discounts), "branch_id": branch_id} for item in cart],
+        "total_quantity": totals["total_quantity"],
+        "total_price": totals["total_price"],  # Amount charged, after discounts
+        "total_cost": totals["total_cost"],
+        "order_time": order_times.now(),
+        "prepared_time": None,  # To be updated when the order is prepared
+        "payment_status": "pending",  # Updated by the payment reconciler
+    }
+
+
+@transactional
+def _commit_in_transaction(transaction, branch_ref, order_ref, cart, order):
+    # Validation, stock deduction and the order insert commit together or not at all
+    if order_ref is not None and order_ref.get(transaction=transaction).exists:
+        return  # Already committed by an earlier attempt; do not deduct twice
+    branch_doc = branch_ref.get(transaction=transaction)
+    if not branch_doc.exists:
+        raise InsufficientInventoryError(f"Branch with ID '{branch_ref.id}' not found.")
+
+    deduct_inventory(transaction, branch_ref, branch_doc.to_dict(), cart)
+    if order_ref is not None:
+        transaction.set(order_ref, order)
+        # Keep the branch's daily sales rollup in step with the order
+        record_order(transaction, order)
+
+
+def commit_order(order, order_id=None):
+    """Write an order, its inventory deduction and its sales rollup in one commit.
+
+    When the cached stock covers the order, everything goes out in a single
+    ``WriteBatch`` (one round trip) whose deduction only applies if the
+    stock is unchanged since it was cached. Otherwise, or if it changed,
+    the stock is checked and deducted in a transaction. Returns the order ID. Raises
+    ``InsufficientInventoryError`` and writes nothing if the branch cannot
+    fulfil the order.
+
+    ``order_id`` makes the commit safe to replay: if that order already
+    exists, nothing is written and no stock is deducted again.
+    """
+    branch_id = order["branch_id"]
+    cart = order["items"]
+    order_ref = db.collection("orders").document(order_id)
+
+    plan = plan_inventory_deduction(branch_id, cart)
+    committed = False
+    if plan is not None:
+        batch = db.batch()
+        stage_inventory_deduction(batch, plan)
+        # create() rather than set(): replaying an order that already landed fails instead of deducting twice
+        batch.create(order_ref, order)
+        record_order(batch, order)
+        try:
+            results = batch.commit()
+            committed = True
+            note_inventory_deducted(branch_id, plan, results[0].update_time)
+        except Exception:
+            # The stock changed since it was cached, or an earlier attempt committed; the transaction checks
+            invalidate_inventory_cache(branch_id)
+    if not committed:
+        branch_ref = db.collection("branches").document(branch_id)
+        _commit_in_transaction(db.transaction(), branch_ref, order_ref, cart, order)
+        invalidate_inventory_cache(branch_id)
+    # Only written when the branch crosses a low-stock threshold
+    update_low_stock_flag(branch_id)
+    return order_ref.id
+
+
+def commit_orders(orders):
+    """Commit many ``(order_id, order)`` pairs in as few ``WriteBatch`` round trips as possible.
+
+    Orders the cached stock covers share batches of up to
+    ``ORDERS_PER_BATCH``, with one conditional deduction per branch; the
+    rest go through ``commit_order`` one by one.
+    A batch that fails is retried order by order the same way. Returns
+    ``{order_id: message}`` for orders the branch could not fulfil. Any
+    other failure propagates; every order can be replayed safely, as none
+    is written or deducted twice.
+    """
+    rejected = {}
+    individually = []
+    branch_ids = set()
+    for start in range(0, len(orders), ORDERS_PER_BATCH):
+        batch = db.batch()
+        carts = {}  # branch_id -> items of every order staged for it in this batch
+        plans = {}
+        staged = []
+        for order_id, order in orders[start:start + ORDERS_PER_BATCH]:
+            branch_id = order["branch_id"]
+            cart = carts.get(branch_id, []) + order["items"]
+            # One deduction per branch covers all of its orders in this batch; the rest go through the transaction
+            plan = plan_inventory_deduction(branch_id, cart)
+            if plan is None:
+                individually.append((order_id, order))
+                continue
+            carts[branch_id] = cart
+            plans[branch_id] = plan
+            staged.append((order_id, order))
+            batch.create(db.collection("orders").document(order_id), order)
+            record_order(batch, order)
+        if not plans:
+            continue
+        for plan in plans.values():
+            stage_inventory_deduction(batch, plan)
+        try:
+            results = batch.commit()
+        except Exception:
+            # Usually a branch's stock changed since it was cached; commit_order re-checks each order
+            for branch_id in plans:
+                invalidate_inventory_cache(branch_id)
+            individually.extend(staged)
+            continue
+        for branch_id, plan in plans.items():
+            note_inventory_deducted(branch_id, plan, results[0].update_time)
+        branch_ids.update(plans)
+
+    for order_id, order in individually:
+        try:
+            commit_order(order, order_id)
+        except InsufficientInventoryError as e:
+            rejected[order_id] = str(e)
+
+    for branch_id in branch_ids:
+        update_low_stock_flag(branch_id)
+    return rejected
+
+
+def deduct_branch_inventory(cart, branch_id):
+    """Deduct a cart's ingredients from a branch without recording an order."""
+    branch_ref = db.collection("branches").document(branch_id)
+    _commit_in_transaction(db.transaction(), branch_ref, None, cart, None)
+    invalidate_inventory_cache(branch_id)
+    update_low_stock_flag(branch_id)
+
+
+def _snapshot_legacy_lines(order):
+    # Known drinks keep their menu price with the order's overall discount spread evenly across
+    # them; drinks no longer on the menu share whatever part of the charged amount is left over
+    items = order["items"]
+    known = [item for item in items if item["coffee"] in menu]
+    list_price = sum(menu[item["coffee"]]["price"] * item["quantity"] for item in known)
+    list_cost = sum(menu[item["coffee"]]["cost"] * item["quantity"] for item in known)
+    retired_quantity = sum(item["quantity"] for item in items if item["coffee"] not in menu)
+    if "total_price" in order:
+        charged = order["total_price"]
+        retired_cost_total = max(order.get("total_cost", list_cost) - list_cost, 0)
+    else:
+        # Saved by the original checkout, which stored the amount charged in total_cost and no cost at all
+        charged = order.get("total_cost", list_price)
+        retired_cost_total = 0
+
+    discount = 0
+    if not retired_quantity and list_price:
+        discount = min(max((1 - charged / list_price) * 100, 0), 100)
+    retired_price = max(charged - list_price, 0) / retired_quantity if retired_quantity else 0
+    retired_cost = retired_cost_total / retired_quantity if retired_quantity else 0
+
+    lines = []
+    for item in items:
+        if item["coffee"] in menu:
+            unit_price, unit_cost, line_discount = menu[item["coffee"]]["price"], menu[item["coffee"]]["cost"], discount
+        else:
+            unit_price, unit_cost, line_discount = retired_price, retired_cost, 0
+        lines.append({
+            **item,
+            "unit_price": unit_price,
+            "unit_cost": unit_cost,
+            "discount": line_discount,
+            "price": unit_price * item["quantity"] * (100 - line_discount) / 100,
+            "cost": unit_cost * item["quantity"],
+        })
+    return lines
+
+
+def backfill_line_prices():
+    """Snapshot prices, costs and discounts onto order lines saved without them.
+
+    The current menu is the best record left of what older orders cost, so
+    it supplies the unit prices and costs. The discount on menu drinks is
+    derived from the amount the order was charged: ``total_price``, or
+    ``total_cost`` on orders saved before ``total_price`` existed. Drinks no
+    longer on the menu share whatever charged amount (and, where a real
+    ``total_cost`` was stored, cost) the menu drinks leave over. Returns the
+    number of orders updated.
+    """
+    updates = []
+    for o in db.collection("orders").stream():
+        order = o.to_dict()
+        items = order.get("items") or []
+        if items and not all("unit_price" in item for item in items):
+            updates.append(("update", o.reference, {"items": _snapshot_legacy_lines(order)}))
+
+    return commit_in_batches(updates)
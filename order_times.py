@@ -0,0 +1,73 @@
+# order_times.py
+import datetime
+
+from firebase_init import commit_in_batches, db
+
+# Format of the legacy string timestamps, still used for display
+ORDER_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def local_timezone():
+    return datetime.datetime.now().astimezone().tzinfo
+
+
+def now():
+    # Timezone-aware, so Firestore stores the right instant instead of assuming UTC
+    return datetime.datetime.now().astimezone()
+
+
+def to_datetime(value):
+    """Return a timezone-aware local datetime for a Timestamp or a legacy string."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return datetime.datetime.strptime(value, ORDER_TIME_FORMAT).astimezone()
+    if value.tzinfo is None:
+        return value.astimezone()
+    return value.astimezone(local_timezone())
+
+
+def format_order_time(value):
+    """Format a Timestamp or legacy string for display."""
+    if value is None:
+        return ""
+    return to_datetime(value).strftime(ORDER_TIME_FORMAT)
+
+
+def to_local_series(values):
+    """Vectorized ``to_datetime`` for a column, returning naive local datetime64 values."""
+    import pandas as pd  # Imported here so pages that only format times skip loading pandas
+
+    raw = pd.Series(values, dtype=object)
+    result = pd.Series(pd.NaT, index=raw.index, dtype="datetime64[ns]")
+    is_string = raw.map(type) == str
+    if is_string.any():
+        result[is_string] = pd.to_datetime(raw[is_string], format=ORDER_TIME_FORMAT)
+    is_timestamp = ~is_string & raw.notna()
+    if is_timestamp.any():
+        result[is_timestamp] = pd.to_datetime(raw[is_timestamp], utc=True) \
+            .dt.tz_convert(local_timezone()).dt.tz_localize(None)
+    return result
+
+
+def day_bounds(start_date, end_date=None):
+    """Return ``[start of start_date, start of the day after end_date)`` as local datetimes."""
+    end_date = end_date or start_date
+    start = datetime.datetime.combine(start_date, datetime.time.min).astimezone()
+    end = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min).astimezone()
+    return start, end
+
+
+def migrate_order_times():
+    """Convert legacy string ``order_time``/``prepared_time`` values to native timestamps.
+
+    Range filters only match values of the same type, so ``>= ""`` selects
+    exactly the documents that still hold strings. Returns the number of
+    orders updated.
+    """
+    updates = {}
+    for field in ("order_time", "prepared_time"):
+        for o in db.collection("orders").where(field, ">=", "").stream():
+            updates.setdefault(o.id, (o.reference, {}))[1][field] = to_datetime(o.get(field))
+
+    return commit_in_batches(("update", order_ref, fields) for order_ref, fields in updates.values())
@@ -0,0 +1,106 @@
+# page_registry.py
+import importlib
+import sys
+import threading
+import time
+
+import streamlit as st
+
+# Navigation label -> (module, function); a module is imported the first time its page is opened
+ADMIN_PAGES = {
+    "Inventory Management": ("inventory", "inventory_management"),
+    "Sales Reporting": ("sales_reporting", "sales_reporting"),
+    "Analytics Dashboard": ("analytics", "analytics_dashboard"),
+    "Promotions & Discounts": ("promotions", "promotions_management"),
+    "Notification": ("notification", "notification_management"),
+    "About Us": ("about_us", "about_us"),
+}
+
+CUSTOMER_PAGES = {
+    "Order": ("order", "customer_order"),
+    "Order History": ("order_history", "order_history"),
+    "Pickup Notification": ("pickup_notification", "pickup_notification"),
+    "Feedback": ("feedback", "feedback"),
+    "About Us": ("about_us", "about_us"),
+}
+
+# Approximately the process start, since main.py imports this module first
+_PROCESS_STARTED = time.perf_counter()
+
+
+class PageTimings:
+    """Process-wide record of cold-start, import and render times per page."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._startup = None
+        self._pages = {}
+
+    def record_startup(self, seconds):
+        with self._lock:
+            if self._startup is None:
+                self._startup = seconds
+
+    def record_import(self, label, seconds):
+        with self._lock:
+            self._pages.setdefault(label, {})["import"] = seconds
+
+    def record_render(self, label, seconds):
+        with self._lock:
+            page = self._pages.setdefault(label, {})
+            page.setdefault("first_render", seconds)
+            page["last_render"] = seconds
+            page["renders"] = page.get("renders", 0) + 1
+
+    def report(self):
+        """Return the timings as rows for ``st.dataframe``, in milliseconds."""
+        with self._lock:
+            rows = []
+            if self._startup is not None:
+                rows.append({"Page": "(cold start)", "Import (ms)": round(self._startup * 1000, 1)})
+            for label, page in self._pages.items():
+                rows.append({
+                    "Page": label,
+                    "Import (ms)": round(page["import"] * 1000, 1) if "import" in page else None,
+                    "First Render (ms)": round(page["first_render"] * 1000, 1) if "first_render" in page else None,
+                    "Last Render (ms)": round(page["last_render"] * 1000, 1) if "last_render" in page else None,
+                    "Renders": page.get("renders", 0),
+                })
+            return rows
+
+
+@st.cache_resource
+def get_page_timings():
+    # Shared by all sessions so the report covers the whole process
+    timings = PageTimings()
+    timings.record_startup(time.perf_counter() - _PROCESS_STARTED)
+    return timings
+
+
+def load_page(label, pages):
+    """Import the module behind ``label`` on first use and return its page function."""
+    module_name, function_name = pages[label]
+    started = time.perf_counter()
+    first_import = module_name not in sys.modules
+    module = importlib.import_module(module_name)
+    if first_import:
+        get_page_timings().record_import(label, time.perf_counter() - started)
+    return getattr(module, function_name)
+
+
+def render_page(label, pages):
+    """Render the selected page, recording how long it took."""
+    page = load_page(label, pages)
+    started = time.perf_counter()
+    page()
+    get_page_timings().record_render(label, time.perf_counter() - started)
+
+
+def startup_timing_report():
+    """Show the cold-start and per-page timings."""
+    with st.sidebar.expander("Startup Timings"):
+        rows = get_page_timings().report()
+        if rows:
+            st.dataframe(rows, hide_index=True)
+        else:
+            st.caption("No pages rendered yet.")
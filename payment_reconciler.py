@@ -0,0 +1,94 @@
+# payment_reconciler.py
+import logging
+import time
+
+import streamlit as st
+from firebase_init import commit_in_batches, db
+from periodic_worker import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+# Seconds between reconciliation passes
+RECONCILE_INTERVAL = 60
+
+# Checkout sessions fetched per Session.list page (Stripe's maximum)
+LIST_PAGE_SIZE = 100
+
+# Stripe Checkout sessions expire within 24 hours, so nothing older can still change
+SESSION_LIFETIME = 24 * 60 * 60
+
+# Document holding the reconciliation watermark
+WATERMARK_DOC = ("app_state", "payment_reconciliation")
+
+
+def _payment_status(session):
+    if session.status == "expired":
+        return "expired"
+    return session.payment_status  # "paid", "unpaid" or "no_payment_required"
+
+
+def reconcile_payments():
+    """Copy the payment status of recent Checkout sessions onto their orders.
+
+    Lists sessions created since the stored watermark with paginated
+    ``Session.list`` calls, matches them to orders by ``client_reference_id``
+    and writes changed ``payment_status`` values in batches of up to 500.
+    The watermark then moves to the oldest session that is still open or
+    whose order has not been committed yet.
+    Returns the number of orders updated.
+    """
+    # Imported here so the worker, not app startup, pays for loading Stripe (and never for the order code)
+    from stripe_client import stripe
+
+    watermark_ref = db.collection(WATERMARK_DOC[0]).document(WATERMARK_DOC[1])
+    watermark_doc = watermark_ref.get()
+    started = int(time.time())
+    since = watermark_doc.get("created_since") if watermark_doc.exists else started - SESSION_LIFETIME
+
+    statuses = {}
+    still_open = []
+    sessions = stripe.checkout.Session.list(created={"gte": since}, limit=LIST_PAGE_SIZE)
+    for session in sessions.auto_paging_iter():
+        if session.status == "open":
+            still_open.append(session.created)
+        if session.client_reference_id:
+            statuses[session.client_reference_id] = (session.id, _payment_status(session), session.created)
+
+    # Only touch orders that exist and whose status changed
+    order_refs = [db.collection("orders").document(order_id) for order_id in statuses]
+    updates = []
+    for order_doc in db.get_all(order_refs) if order_refs else []:
+        session_id, status, created = statuses[order_doc.id]
+        if not order_doc.exists:
+            # Possibly still in the order outbox; look at this session again next pass
+            if created > started - SESSION_LIFETIME:
+                still_open.append(created)
+            continue
+        order = order_doc.to_dict()
+        if order.get("payment_status") != status or order.get("checkout_session_id") != session_id:
+            updates.append(("update", order_doc.reference, {"payment_status": status, "checkout_session_id": session_id}))
+
+    commit_in_batches(updates)
+    watermark_ref.set({"created_since": min(still_open + [started])})
+    return len(updates)
+
+
+class PaymentReconciler(PeriodicWorker):
+    """Daemon thread that periodically reconciles order payment statuses with Stripe."""
+
+    def __init__(self, interval=RECONCILE_INTERVAL):
+        # Nothing paid in the first minute is lost: the watermark makes the first pass pick it up
+        super().__init__("payment-reconciler", interval, delay_first=True)
+
+    def work(self):
+        updated = reconcile_payments()
+        if updated:
+            logger.info("Updated the payment status of %d order(s)", updated)
+
+
+@st.cache_resource
+def start_payment_reconciler():
+    # One reconciler thread per server process
+    reconciler = PaymentReconciler()
+    reconciler.start()
+    return reconciler
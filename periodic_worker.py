@@ -0,0 +1,36 @@
+# periodic_worker.py
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker(threading.Thread):
+    """Daemon thread that calls ``work()`` every ``interval`` seconds until stopped.
+
+    Subclasses implement ``work()``. A failing run is logged and the next
+    one still happens on schedule. With ``delay_first`` the first run also
+    waits one interval, keeping its imports and calls away from app startup.
+    """
+
+    def __init__(self, name, interval, delay_first=False):
+        super().__init__(name=name, daemon=True)
+        self._interval = interval
+        self._delay_first = delay_first
+        self._stop_event = threading.Event()
+
+    def work(self):
+        raise NotImplementedError
+
+    def run(self):
+        if self._delay_first:
+            self._stop_event.wait(self._interval)
+        while not self._stop_event.is_set():
+            try:
+                self.work()
+            except Exception:
+                logger.exception("Background job %s failed", self.name)
+            self._stop_event.wait(self._interval)
+
+    def stop(self):
+        self._stop_event.set()
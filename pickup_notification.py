@@ -2,45 +2,82 @@
 import streamlit as st
 from firebase_init import db
 import datetime
+from branch_directory import get_branch_directory
+from order_times import day_bounds, format_order_time, to_datetime
+from firestore_trace import trace_fragment
+from order_outbox import get_order_outbox, show_outbox_status
 
-def pickup_notification():
-    st.title("Pickup Notification")
+# Seconds between status checks of the customer's open orders
+PICKUP_STATUS_REFRESH = 10
 
-    # Get today's date
-    today = datetime.datetime.now().date()
 
+def _load_todays_orders(customer, today):
     # Fetch customer's orders placed today
+    start, end = day_bounds(today)
     orders_ref = db.collection("orders") \
-        .where("customer", "==", st.session_state["authenticated_user"]) \
+        .where("customer", "==", customer) \
+        .where("order_time", ">=", start) \
+        .where("order_time", "<", end) \
         .stream()
-    customer_orders = [
-        {"id": o.id, **o.to_dict()}
-        for o in orders_ref
-        if datetime.datetime.strptime(o.to_dict()["order_time"], "%Y-%m-%d %H:%M:%S").date() == today
+    orders = {o.id: {"id": o.id, **o.to_dict()} for o in orders_ref}
+    # Orders placed moments ago may still be waiting in the outbox, or have been turned down there
+    for order_id, order in get_order_outbox().queued_orders(customer).items():
+        if order_id not in orders and start <= to_datetime(order["order_time"]) < end:
+            orders[order_id] = {"id": order_id, **order}
+    return orders
+
+
+def _refresh_outbox_orders(orders):
+    # Local reads only. Orders that have left the outbox were committed and are followed in Firestore from now on
+    queued = [order_id for order_id, order in orders.items() if "outbox_status" in order]
+    statuses = get_order_outbox().statuses(queued)
+    for order_id in queued:
+        order = orders[order_id]
+        if order_id in statuses:
+            order["outbox_status"], order["outbox_error"], order["payment_cancelled"] = statuses[order_id]
+        else:
+            for key in ("outbox_status", "outbox_error", "payment_cancelled"):
+                order.pop(key, None)
+
+
+def _refresh_open_orders(orders):
+    _refresh_outbox_orders(orders)
+    # Re-read only the orders still being prepared; nothing is read once all are ready or turned down
+    open_refs = [
+        db.collection("orders").document(order_id)
+        for order_id, order in orders.items()
+        if not order.get("prepared_time") and "outbox_status" not in order
     ]
+    if not open_refs:
+        return
+    for order_doc in db.get_all(open_refs):
+        if not order_doc.exists:
+            continue
+        prepared_time = order_doc.get("prepared_time")
+        if prepared_time:
+            orders[order_doc.id]["prepared_time"] = prepared_time
+            st.toast(f"Order {order_doc.id} is ready for pickup!", icon="☕")
+
+
+@st.fragment(run_every=PICKUP_STATUS_REFRESH)
+@trace_fragment("Pickup Notification")
+def _pickup_status(feed):
+    # Only this fragment refreshes; the rest of the app is not rerun
+    if not feed.pop("just_loaded", False):
+        _refresh_open_orders(feed["orders"])
+    customer_orders = list(feed["orders"].values())
 
     if customer_orders:
         st.subheader("Your orders today 😋:")
-        branch_cache = {}  # Cache to store branch names
+        # Resolve every branch on the page at once from the shared branch directory
+        branch_names = get_branch_directory().names_for(order.get("branch_id", "N/A") for order in customer_orders)
         for order in customer_orders:
             # Parse order time
-            order_time = datetime.datetime.strptime(order["order_time"], "%Y-%m-%d %H:%M:%S")
+            order_time = to_datetime(order["order_time"])
             prepared_time = order.get("prepared_time")
 
             # Get branch name
-            branch_id = order.get('branch_id', 'N/A')
-            if branch_id != 'N/A':
-                if branch_id in branch_cache:
-                    branch_name = branch_cache[branch_id]
-                else:
-                    branch_doc = db.collection('branches').document(branch_id).get()
-                    if branch_doc.exists:
-                        branch_name = branch_doc.to_dict().get('cafe_name', 'Unknown Branch')
-                        branch_cache[branch_id] = branch_name
-                    else:
-                        branch_name = 'Unknown Branch'
-            else:
-                branch_name = 'N/A'
+            branch_name = branch_names[order.get('branch_id', 'N/A')]
 
             # Display order details within a container with a border
             container = st.container(border=True)
@@ -57,9 +94,27 @@ def pickup_notification():
                     st.write(f"{quantity}x {coffee_name}")
 
                 # Display preparation status
-                if prepared_time:
-                    st.success(f"**Status:** Ready for pickup since {prepared_time}.")
+                if "outbox_status" in order:
+                    show_outbox_status(order)
+                elif prepared_time:
+                    st.success(f"**Status:** Ready for pickup since {format_order_time(prepared_time)}.")
                 else:
                     st.info("**Status:** Being prepared. Please wait for a notification.")
     else:
         st.warning("You have no orders awaiting pickup today.")
+
+
+def pickup_notification():
+    st.title("Pickup Notification")
+
+    # Get today's date
+    today = datetime.datetime.now().date()
+    customer = st.session_state["authenticated_user"]
+
+    # Today's orders are read once per session and day; checkout clears them so new orders show up
+    feed = st.session_state.get("pickup_orders")
+    if not feed or feed["customer"] != customer or feed["day"] != today:
+        feed = {"customer": customer, "day": today, "orders": _load_todays_orders(customer, today), "just_loaded": True}
+        st.session_state["pickup_orders"] = feed
+
+    _pickup_status(feed)
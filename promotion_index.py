@@ -0,0 +1,74 @@
+# promotion_index.py
+import datetime
+
+import streamlit as st
+from firebase_init import db
+from listener_cache import ListenerCache
+
+# Reload interval (seconds) used when the snapshot listener is unavailable
+PROMOTION_INDEX_TTL = 300
+
+
+class PromotionIndex(ListenerCache):
+    """Process-wide index of active promotions keyed by coffee.
+
+    Built once from the ``promotions`` collection and kept fresh by an
+    ``on_snapshot`` listener (or a TTL when no listener is available), so the
+    order page finds applicable promotions in O(cart size) without reading
+    Firestore. Expired promotions are evicted as they are encountered.
+    """
+
+    def __init__(self, ttl=PROMOTION_INDEX_TTL):
+        self._by_coffee = {}
+        super().__init__(ttl)
+
+    def _query(self):
+        return db.collection("promotions").where("type", "==", "Promotion")
+
+    def _rebuild(self, docs):
+        today = datetime.date.today().isoformat()
+        by_coffee = {}
+        for position, doc in enumerate(docs):
+            promo = {"id": doc.id, **doc.to_dict()}
+            if promo.get("expiration_date", "") < today:
+                continue
+            for coffee in promo.get("included_coffees", []):
+                by_coffee.setdefault(coffee, []).append((position, promo))
+        with self._lock:
+            self._by_coffee = by_coffee
+
+    def applicable(self, coffees):
+        """Return the active promotions that include any of ``coffees``."""
+        self._ensure_fresh()
+        today = datetime.date.today().isoformat()
+        matches = {}
+        with self._lock:
+            for coffee in set(coffees):
+                entries = self._by_coffee.get(coffee)
+                if not entries:
+                    continue
+                # Evict promotions that expired since the index was built
+                active = [(position, promo) for position, promo in entries if promo["expiration_date"] >= today]
+                if len(active) != len(entries):
+                    self._by_coffee[coffee] = active
+                for position, promo in active:
+                    matches[promo["id"]] = (position, promo)
+        return [dict(promo) for _, promo in sorted(matches.values(), key=lambda match: match[0])]
+
+
+@st.cache_resource
+def get_promotion_index():
+    # One index (and one listener) per server process, shared by all sessions
+    return PromotionIndex()
+
+
+def find_coupon(coupon_code):
+    """Return the coupon with this exact code, or ``None``, using an indexed equality query."""
+    if not coupon_code:
+        return None
+    coupon_docs = db.collection("promotions") \
+        .where("type", "==", "Coupon") \
+        .where("coupon_code", "==", coupon_code) \
+        .limit(1) \
+        .get()
+    return coupon_docs[0].to_dict() if coupon_docs else None
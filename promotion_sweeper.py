@@ -0,0 +1,44 @@
+# promotion_sweeper.py
+import datetime
+import logging
+
+import streamlit as st
+from firebase_init import commit_in_batches, db
+from periodic_worker import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps for expired promotions
+SWEEP_INTERVAL = 3600
+
+
+def sweep_expired_promotions(today=None):
+    """Delete every promotion and coupon that expired before ``today``.
+
+    ``expiration_date`` is an ISO ``YYYY-MM-DD`` string, so a range filter
+    selects exactly the expired documents. Deletes go out in batches of up to
+    500. Returns the number of documents deleted.
+    """
+    today = (today or datetime.date.today()).isoformat()
+    expired = db.collection("promotions").where("expiration_date", "<", today).get()
+    return commit_in_batches(("delete", promo_doc.reference) for promo_doc in expired)
+
+
+class PromotionSweeper(PeriodicWorker):
+    """Daemon thread that periodically deletes expired promotions."""
+
+    def __init__(self, interval=SWEEP_INTERVAL):
+        super().__init__("promotion-sweeper", interval)
+
+    def work(self):
+        deleted = sweep_expired_promotions()
+        if deleted:
+            logger.info("Deleted %d expired promotion(s)", deleted)
+
+
+@st.cache_resource
+def start_promotion_sweeper():
+    # One sweeper thread per server process
+    sweeper = PromotionSweeper()
+    sweeper.start()
+    return sweeper
@@ -3,22 +3,17 @@ import streamlit as st
 import datetime
 from firebase_init import db
 from menu import menu
+from promotion_index import get_promotion_index
+from promotion_sweeper import start_promotion_sweeper
 
 def promotions_management():
     st.title("Promotions & Discounts Management")
 
-    # Fetch current promotions and filter out expired ones
+    # Fetch current promotions; expired ones are deleted by the background sweeper
     today = datetime.date.today()
-    promotions_ref = db.collection("promotions").stream()
-    promotions = []
-    for p in promotions_ref:
-        promo_data = p.to_dict()
-        expiration_date = datetime.datetime.strptime(promo_data["expiration_date"], "%Y-%m-%d").date()
-        if expiration_date >= today:
-            promotions.append({"id": p.id, **promo_data})
-        else:
-            # Optionally, delete expired promotions from the database
-            db.collection("promotions").document(p.id).delete()
+    start_promotion_sweeper()
+    promotions_ref = db.collection("promotions").where("expiration_date", ">=", today.isoformat()).stream()
+    promotions = [{"id": p.id, **p.to_dict()} for p in promotions_ref]
 
     # Display Current Promotions and Coupons
     st.subheader("Current Promotions and Coupons")
@@ -42,6 +37,7 @@ def promotions_management():
                 if st.button(f"Terminate '{display_name}'", key=terminate_key):
                     # Delete the promotion immediately without confirmation
                     db.collection("promotions").document(promo["id"]).delete()
+                    get_promotion_index().invalidate()
                     st.success(f"{promo_type} '{display_name}' has been terminated.")
                     st.rerun()
     else:
@@ -84,6 +80,7 @@ def promotions_management():
                         "expiration_date": expiration_date.strftime("%Y-%m-%d"),
                     }
                     db.collection("promotions").add(new_promo)
+                    get_promotion_index().invalidate()
 
                     # Store success message in session state
                     display_name = promo_name if promo_type == "Promotion" else coupon_code
@@ -0,0 +1,50 @@
+# recipe_matrix.py
+import numpy as np
+
+from menu import menu
+
+# Row and column labels of the requirement matrix
+DRINKS = list(menu)
+INGREDIENTS = sorted({ingredient for details in menu.values() for ingredient in details["requirements"]})
+
+_DRINK_INDEX = {coffee: column for column, coffee in enumerate(DRINKS)}
+
+# REQUIREMENTS[i, j] is how much of ingredient i one drink j uses
+REQUIREMENTS = np.zeros((len(INGREDIENTS), len(DRINKS)), dtype=np.int64)
+for _column, _details in enumerate(menu.values()):
+    for _ingredient, _amount in _details["requirements"].items():
+        REQUIREMENTS[INGREDIENTS.index(_ingredient), _column] = _amount
+
+
+def inventory_vector(inventory):
+    """Return the stock of each ingredient in ``INGREDIENTS`` order (missing items count as 0)."""
+    return np.array([inventory.get(ingredient, 0) for ingredient in INGREDIENTS], dtype=np.int64)
+
+
+def cart_vector(cart):
+    """Return the ordered quantity of each drink in ``DRINKS`` order."""
+    quantities = np.zeros(len(DRINKS), dtype=np.int64)
+    for item in cart:
+        quantities[_DRINK_INDEX[item["coffee"]]] += item["quantity"]
+    return quantities
+
+
+def required_vector(cart):
+    """Return the total amount of each ingredient the cart needs."""
+    return REQUIREMENTS @ cart_vector(cart)
+
+
+def max_makeable(inventory, reserved_cart=None):
+    """Return ``{coffee: how many more could be made}`` after setting aside ``reserved_cart``."""
+    stock = inventory_vector(inventory)
+    if reserved_cart:
+        stock = stock - required_vector(reserved_cart)
+    stock = np.maximum(stock, 0)[:, None]
+    used = REQUIREMENTS > 0
+    per_ingredient = np.where(used, stock // np.where(used, REQUIREMENTS, 1), np.iinfo(np.int64).max)
+    return dict(zip(DRINKS, per_ingredient.min(axis=0).tolist()))
+
+
+def cart_is_feasible(cart, inventory):
+    """Return whether the stock covers the whole cart, in one vector comparison."""
+    return bool(np.all(required_vector(cart) <= inventory_vector(inventory)))
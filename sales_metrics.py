@@ -0,0 +1,56 @@
+# sales_metrics.py
+from firebase_init import commit_in_batches, db
+from menu import menu
+
+
+def order_totals(branch_id, start, end):
+    """Return headline order metrics for a branch between ``start`` (inclusive) and ``end``.
+
+    Uses a Firestore aggregation query (``count``/``sum``/``avg``) so only the
+    aggregate results are downloaded, never the order documents. The local
+    backend evaluates the same query client-side.
+    """
+    orders_query = db.collection("orders") \
+        .where("branch_id", "==", branch_id) \
+        .where("order_time", ">=", start) \
+        .where("order_time", "<", end)
+    aggregation = orders_query.count(alias="order_count") \
+        .sum("total_price", alias="revenue") \
+        .sum("total_cost", alias="cost") \
+        .avg("total_price", alias="avg_order_value")
+
+    results = {result.alias: result.value for result in aggregation.get()[0]}
+    revenue = results.get("revenue") or 0
+    cost = results.get("cost") or 0
+    return {
+        "order_count": int(results.get("order_count") or 0),
+        "revenue": revenue,
+        "cost": cost,
+        "profit": revenue - cost,
+        "avg_order_value": results.get("avg_order_value") or 0,
+    }
+
+
+def migrate_order_totals():
+    """Bring orders saved by the original checkout in line with the ``total_price``/``total_cost`` schema.
+
+    That checkout stored the amount charged (after discounts) in
+    ``total_cost`` and never wrote ``total_price``, so ``order_totals`` would
+    count its revenue as cost. Such orders get ``total_price`` from the old
+    ``total_cost``, and ``total_cost`` and ``total_quantity`` re-derived from
+    their items (drinks no longer on the menu count no cost). A field cannot
+    be queried for being absent, so every order is scanned. Returns the
+    number of orders updated.
+    """
+    updates = []
+    for o in db.collection("orders").stream():
+        order = o.to_dict()
+        if "total_price" in order:
+            continue
+        items = order.get("items") or []
+        updates.append(("update", o.reference, {
+            "total_price": order.get("total_cost", 0),
+            "total_cost": sum(menu[item["coffee"]]["cost"] * item["quantity"] for item in items if item["coffee"] in menu),
+            "total_quantity": sum(item["quantity"] for item in items),
+        }))
+    return commit_in_batches(updates)
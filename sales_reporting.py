@@ -1,66 +1,67 @@
 # sales_reporting.py
 import streamlit as st
-from firebase_init import db
 import pandas as pd
 import datetime
-from menu import menu  # Import menu to get price and cost data
+from branch_directory import get_branch_directory
+from sales_rollups import get_rollups, rebuild_rollups
+from sales_metrics import migrate_order_totals, order_totals
+from order_times import day_bounds, migrate_order_times
+from order_service import backfill_line_prices
+
+# Number of days shown by default in the sales report
+DEFAULT_REPORT_DAYS = 30
 
 def sales_reporting():
     st.title("Sales Reporting")
 
-    # Fetch the list of branches
-    branches_ref = db.collection("branches").stream()
-    branches = [{"id": branch.id, **branch.to_dict()} for branch in branches_ref]
+    # Fetch the list of branches from the shared branch directory
+    directory = get_branch_directory()
+    branch_names = directory.names()
 
-    if branches:
+    if branch_names:
         # Wrap branch selection in a container
         with st.container(border=True):
             st.subheader("Select Branch for Sales Reporting")
             # Select a branch for sales reporting
-            branch_names = [branch["cafe_name"] for branch in branches]
             selected_branch_name = st.selectbox("Select Branch", branch_names)
-            selected_branch_id = next(
-                branch["id"] for branch in branches if branch["cafe_name"] == selected_branch_name)
+            selected_branch_id = directory.id_for(selected_branch_name)
+
+            # Select the reporting period; page cost grows with the days shown, not with order history
+            today = datetime.date.today()
+            date_range = st.date_input(
+                "Reporting Period",
+                value=(today - datetime.timedelta(days=DEFAULT_REPORT_DAYS - 1), today),
+                max_value=today,
+            )
+            start_date, end_date = date_range if len(date_range) == 2 else (date_range[0], date_range[0])
 
-        # Fetch Orders for the selected branch
-        orders_ref = db.collection("orders").where("branch_id", "==", selected_branch_id).stream()
-        orders = []
-        for o in orders_ref:
-            order_data = o.to_dict()
-            order_time = order_data["order_time"]
-            items = order_data.get("items", [])
-            for item in items:
-                coffee = item["coffee"]
-                quantity = item["quantity"]
-                price_per_item = menu[coffee]["price"]
-                cost_per_item = menu[coffee]["cost"]
-                total_price = price_per_item * quantity
-                total_cost = cost_per_item * quantity
-                orders.append({
-                    "coffee": coffee,
-                    "quantity": quantity,
-                    "price": total_price,
-                    "cost": total_cost,
-                    "order_time": order_time
-                })
+        # Fetch the pre-aggregated daily sales rollups for the selected branch
+        rollups = get_rollups(selected_branch_id, start_date, end_date)
 
-        # Convert Orders to DataFrame
-        if orders:
-            df = pd.DataFrame(orders)
-            df["order_time"] = pd.to_datetime(df["order_time"])
+        # Convert Rollups to DataFrames
+        if rollups:
+            df = pd.DataFrame([
+                {"date": datetime.date.fromisoformat(r["date"]), "price": r["revenue"], "cost": r["cost"]}
+                for r in rollups
+            ])
 
             # Wrap total sales report in a container
             with st.container(border=True):
                 # Total Sales Report
                 st.subheader("Total Sales Report")
-                daily_sales = df.groupby(df["order_time"].dt.date)["price"].sum()
+                daily_sales = df.set_index("date")["price"]
                 st.bar_chart(daily_sales)
 
             # Wrap sales breakdown in a container
             with st.container(border=True):
                 # Sales Breakdown by Coffee Type (Sum Quantities Correctly)
                 st.subheader("Sales Breakdown by Coffee Type")
-                coffee_breakdown = df.groupby("coffee")["quantity"].sum().reset_index()
+                coffee_quantities = pd.DataFrame([
+                    {"coffee": coffee, "quantity": totals["quantity"]}
+                    for r in rollups
+                    for coffee, totals in r.get("coffees", {}).items()
+                ])
+                coffee_breakdown = coffee_quantities.groupby("coffee")["quantity"].sum().reset_index()
                 coffee_breakdown.columns = ["Coffee", "Count"]
 
                 # Add a new "No." column starting from 1
@@ -81,11 +82,32 @@ def sales_reporting():
             with st.container(border=True):
                 # Total Profit Calculation
                 st.subheader("Total Profit Calculation")
-                # Calculate total profit by subtracting costs from prices
-                df["profit"] = df["price"] - df["cost"]
-                total_profit = df["profit"].sum()
+                # Sum prices and costs server-side with an aggregation query
+                total_profit = order_totals(selected_branch_id, *day_bounds(start_date, end_date))["profit"]
                 st.write(f"**Total Profit:** RM {total_profit:.2f}")
         else:
             st.warning(f"No sales data available for the selected branch: {selected_branch_name}.")
+
+        # Wrap data maintenance in a container
+        with st.container(border=True):
+            st.subheader("Data Maintenance")
+            st.write("Rebuild this branch's daily sales rollups from its raw orders (e.g. after a data import).")
+            if st.button("Rebuild Sales Rollups"):
+                rebuilt = rebuild_rollups(selected_branch_id)
+                st.success(f"Rebuilt {rebuilt} daily rollup(s) for {selected_branch_name}.")
+            st.write("Convert orders saved with text timestamps to native Firestore timestamps (all branches).")
+            if st.button("Migrate Order Timestamps"):
+                migrated = migrate_order_times()
+                st.success(f"Migrated {migrated} order(s) to native timestamps.")
+            st.write("Move the amount charged on orders saved without a total price from their total cost to "
+                     "their total price, and recompute their cost from the menu (all branches).")
+            if st.button("Migrate Legacy Order Totals"):
+                migrated = migrate_order_totals()
+                st.success(f"Migrated {migrated} legacy order(s) to the current totals.")
+            st.write("Store prices, costs and discounts on order lines saved without them, then rebuild every rollup.")
+            if st.button("Backfill Order Line Prices"):
+                backfilled = backfill_line_prices()
+                rebuilt = rebuild_rollups()
+                st.success(f"Backfilled {backfilled} order(s) and rebuilt {rebuilt} daily rollup(s).")
     else:
         st.warning("No branches available. Please add branches to manage sales reporting.")
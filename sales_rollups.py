@@ -0,0 +1,180 @@
+# sales_rollups.py
+import random
+
+from firebase_init import commit_in_batches, db, Increment
+from menu import line_amounts
+from order_lines import build_order_lines
+from order_times import to_datetime
+
+ROLLUP_COLLECTION = "sales_rollups"
+
+# Documents each branch's daily rollup is spread over, so busy branches do not contend on one document
+ROLLUP_SHARDS = 10
+
+
+def rollup_id(branch_id, day, shard=0):
+    return f"{branch_id}_{day.isoformat()}_{shard}"
+
+
+def _order_totals(order_data):
+    # Per-coffee revenue, cost and quantity for one order, from the prices snapshotted on its lines
+    coffees = {}
+    for item in order_data.get("items", []):
+        price, cost = line_amounts(item)
+        totals = coffees.setdefault(item["coffee"], {"revenue": 0.0, "cost": 0.0, "quantity": 0})
+        totals["revenue"] += price
+        totals["cost"] += cost
+        totals["quantity"] += item["quantity"]
+    return coffees
+
+
+def order_rollup(order_data):
+    """Return one order's contribution to its daily rollup as plain numbers."""
+    order_time = to_datetime(order_data["order_time"])
+    coffees = _order_totals(order_data)
+    revenue = sum(totals["revenue"] for totals in coffees.values())
+    cost = sum(totals["cost"] for totals in coffees.values())
+    quantity = sum(totals["quantity"] for totals in coffees.values())
+    customer = order_data.get("customer") or "Unknown"
+
+    return {
+        "revenue": revenue,
+        "cost": cost,
+        "quantity": quantity,
+        "order_count": 1,
+        "hours": {
+            f"{order_time.hour:02d}": {
+                "revenue": revenue,
+                "cost": cost,
+                "quantity": quantity,
+                "order_count": 1,
+            }
+        },
+        "coffees": coffees,
+        "customers": {customer: {"revenue": revenue, "order_count": 1}},
+    }
+
+
+def _as_increments(totals):
+    return {
+        key: _as_increments(value) if isinstance(value, dict) else Increment(value)
+        for key, value in totals.items()
+    }
+
+
+def rollup_increments(order_data):
+    """Return the merge-set payload that adds one order to its daily rollup."""
+    return {
+        "branch_id": order_data["branch_id"],
+        "date": to_datetime(order_data["order_time"]).date().isoformat(),
+        **_as_increments(order_rollup(order_data)),
+    }
+
+
+def record_order(writer, order_data):
+    """Add an order to a random shard of its daily rollup using ``writer`` (a transaction or batch)."""
+    day = to_datetime(order_data["order_time"]).date()
+    shard = random.randrange(ROLLUP_SHARDS)
+    rollup_ref = db.collection(ROLLUP_COLLECTION).document(rollup_id(order_data["branch_id"], day, shard))
+    writer.set(rollup_ref, rollup_increments(order_data), merge=True)
+
+
+def _add_totals(total, part):
+    # Sum one shard's (possibly nested) counters into total
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _add_totals(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def get_rollups(branch_id, start_date, end_date):
+    """Return the daily rollups for a branch between two dates (inclusive), oldest first.
+
+    Each day's shards are summed into one rollup.
+    """
+    rollups_ref = db.collection(ROLLUP_COLLECTION) \
+        .where("branch_id", "==", branch_id) \
+        .where("date", ">=", start_date.isoformat()) \
+        .where("date", "<=", end_date.isoformat()) \
+        .stream()
+    rollups = {}
+    for r in rollups_ref:
+        shard = r.to_dict()
+        rollup = rollups.setdefault(shard["date"], {"branch_id": branch_id, "date": shard["date"]})
+        _add_totals(rollup, {key: value for key, value in shard.items() if key not in ("branch_id", "date")})
+    return [rollups[date] for date in sorted(rollups)]
+
+
+def get_rollup(branch_id, day):
+    """Return one day's rollup for a branch, or ``None`` if nothing was sold."""
+    rollups = get_rollups(branch_id, day, day)
+    return rollups[0] if rollups else None
+
+
+def _plain(value):
+    # NumPy scalars from pandas are not accepted by the Firestore client
+    return value.item() if hasattr(value, "item") else value
+
+
+def _nest(frame, key_column, columns, format_key=str):
+    # {(branch_id, day): {key: {column: value}}} from a grouped totals frame
+    nested = {}
+    for row in frame.itertuples(index=False):
+        bucket = nested.setdefault((row.branch_id, row.day), {})
+        bucket[format_key(getattr(row, key_column))] = {column: _plain(getattr(row, column)) for column in columns}
+    return nested
+
+
+def rebuild_rollups(branch_id=None):
+    """Recompute rollups from the raw orders (for backfills and repairs).
+
+    Each day's totals are written to its first shard and the other shards
+    are deleted. Returns the number of rollup documents written.
+    """
+    orders_query = db.collection("orders")
+    if branch_id is not None:
+        orders_query = orders_query.where("branch_id", "==", branch_id)
+
+    lines = build_order_lines(orders_query.stream())
+    lines["day"] = lines["order_time"].dt.normalize()
+    lines["hour"] = lines["order_time"].dt.hour
+    totals = {"price": "sum", "cost": "sum", "quantity": "sum", "order_id": "nunique"}
+    renamed = {"price": "revenue", "order_id": "order_count"}
+
+    def aggregate(keys, columns):
+        return lines.groupby(keys, observed=True).agg({column: totals[column] for column in columns}) \
+            .rename(columns=renamed).reset_index()
+
+    days = aggregate(["branch_id", "day"], totals)
+    hours = _nest(aggregate(["branch_id", "day", "hour"], totals), "hour",
+                  ["revenue", "cost", "quantity", "order_count"], format_key=lambda hour: f"{hour:02d}")
+    coffees = _nest(aggregate(["branch_id", "day", "coffee"], ["price", "cost", "quantity"]), "coffee",
+                    ["revenue", "cost", "quantity"])
+    customers = _nest(aggregate(["branch_id", "day", "customer"], ["price", "order_id"]), "customer",
+                      ["revenue", "order_count"])
+
+    rollups = {}
+    for row in days.itertuples(index=False):
+        key = (row.branch_id, row.day)
+        rollups[rollup_id(row.branch_id, row.day.date())] = {
+            "branch_id": row.branch_id,
+            "date": row.day.date().isoformat(),
+            "revenue": _plain(row.revenue),
+            "cost": _plain(row.cost),
+            "quantity": _plain(row.quantity),
+            "order_count": _plain(row.order_count),
+            "hours": hours.get(key, {}),
+            "coffees": coffees.get(key, {}),
+            "customers": customers.get(key, {}),
+        }
+
+    # Drop stale rollups for the rebuilt branches before writing the fresh ones
+    stale_query = db.collection(ROLLUP_COLLECTION)
+    if branch_id is not None:
+        stale_query = stale_query.where("branch_id", "==", branch_id)
+    writes = [("delete", r.reference) for r in stale_query.stream() if r.id not in rollups]
+    writes += [("set", db.collection(ROLLUP_COLLECTION).document(doc_id), data) for doc_id, data in rollups.items()]
+    commit_in_batches(writes)
+    return len(rollups)
+
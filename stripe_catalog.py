@@ -0,0 +1,132 @@
+# stripe_catalog.py
+import logging
+import threading
+
+import streamlit as st
+from stripe_client import stripe
+from menu import menu
+
+logger = logging.getLogger(__name__)
+
+STRIPE_CURRENCY = "myr"
+
+# Stripe accepts at most 10 lookup keys per Price.list call
+LOOKUP_KEY_BATCH = 10
+
+
+def _lookup_key(coffee):
+    return "menu_" + coffee.lower().replace(" ", "_")
+
+
+def _unit_amount(price):
+    return int(round(price * 100))  # Amount in cents
+
+
+class StripeCatalog:
+    """Process-wide cache of one Stripe Product and Price per menu item.
+
+    Prices carry a ``lookup_key`` per menu item, so a single ``Price.list``
+    finds the current ones. When a menu price changes, a new Price is created
+    for the same Product, takes over the lookup key and the old Price is
+    archived. Checkout then only needs ``checkout.Session.create``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prices = {}  # coffee -> {"price", "product", "unit_amount"}
+
+    def _is_current(self):
+        return all(
+            self._prices.get(coffee, {}).get("unit_amount") == _unit_amount(details["price"])
+            for coffee, details in menu.items()
+        )
+
+    def sync(self):
+        """Reconcile the Stripe Products/Prices with the menu."""
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        lookup = {_lookup_key(coffee): coffee for coffee in menu}
+        keys = list(lookup)
+        current = {}
+        for start in range(0, len(keys), LOOKUP_KEY_BATCH):
+            prices = stripe.Price.list(lookup_keys=keys[start:start + LOOKUP_KEY_BATCH], active=True, limit=100)
+            for price in prices.auto_paging_iter():
+                current[lookup[price.lookup_key]] = price
+
+        synced = {}
+        for coffee, details in menu.items():
+            amount = _unit_amount(details["price"])
+            price = current.get(coffee)
+            if price is None or price.unit_amount != amount or price.currency != STRIPE_CURRENCY:
+                params = {
+                    "currency": STRIPE_CURRENCY,
+                    "unit_amount": amount,
+                    "lookup_key": _lookup_key(coffee),
+                    "transfer_lookup_key": True,
+                    "metadata": {"menu_item": coffee},
+                }
+                if price is not None:
+                    params["product"] = price.product  # Keep the product, replace its price
+                else:
+                    params["product_data"] = {"name": coffee, "metadata": {"menu_item": coffee}}
+                new_price = stripe.Price.create(**params)
+                if price is not None:
+                    stripe.Price.modify(price.id, active=False)
+                price = new_price
+            synced[coffee] = {"price": price.id, "product": price.product, "unit_amount": price.unit_amount}
+        self._prices = synced
+
+    def prices(self):
+        """Return the cached prices, reconciling first if the menu changed."""
+        if not self._is_current():
+            with self._lock:
+                # Another session may have reconciled while we waited
+                if not self._is_current():
+                    self._sync()
+        return self._prices
+
+    def line_items(self, cart, discounts=None):
+        """Build Checkout line items for ``cart`` from the cached Price IDs.
+
+        ``discounts`` maps a coffee to a percentage off; discounted lines keep
+        the cached Product but carry their reduced unit amount inline.
+        """
+        discounts = discounts or {}
+        quantities = {}
+        for item in cart:
+            quantities[item["coffee"]] = quantities.get(item["coffee"], 0) + item["quantity"]
+
+        prices = self.prices()
+        line_items = []
+        for coffee, quantity in quantities.items():
+            entry = prices[coffee]
+            rate = min(discounts.get(coffee, 0), 100)
+            if rate:
+                line_items.append({
+                    "price_data": {
+                        "currency": STRIPE_CURRENCY,
+                        "product": entry["product"],
+                        "unit_amount": int(round(entry["unit_amount"] * (100 - rate) / 100)),
+                    },
+                    "quantity": quantity,
+                })
+            else:
+                line_items.append({"price": entry["price"], "quantity": quantity})
+        return line_items
+
+
+def _warm(catalog):
+    try:
+        catalog.sync()
+    except Exception:
+        logger.exception("Stripe catalog sync failed; retrying at checkout")
+
+
+@st.cache_resource
+def get_stripe_catalog():
+    # One catalog per server process, synced in the background so checkout finds it ready
+    catalog = StripeCatalog()
+    threading.Thread(target=_warm, args=(catalog,), name="stripe-catalog-sync", daemon=True).start()
+    return catalog
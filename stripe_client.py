@@ -0,0 +1,17 @@
+# stripe_client.py
+"""The ``stripe`` module set up for this app; import ``stripe`` from here.
+
+Kept apart from utils so background workers can call Stripe without
+importing the order and inventory code (and with it pandas and NumPy).
+"""
+import os
+
+import stripe
+import streamlit as st
+
+# Securely set your Stripe secret key using st.secrets
+stripe.api_key = st.secrets["stripe"]["stripe_secret_key"]  # Ensure you have added your key to .streamlit/secrets.toml
+
+# Point Stripe at a local stand-in (e.g. `python local_stripe.py`) to run checkout offline
+if os.environ.get("COFFEE_APP_STRIPE_API_BASE"):
+    stripe.api_base = os.environ["COFFEE_APP_STRIPE_API_BASE"]
@@ -0,0 +1,78 @@
+# thumbnails.py
+import hashlib
+import io
+import os
+import threading
+
+from PIL import Image
+
+# Size, format and quality of the menu thumbnails served on the order page
+THUMBNAIL_SIZE = (300, 200)
+THUMBNAIL_FORMAT = "WEBP"
+THUMBNAIL_QUALITY = 80
+
+# Encoded thumbnails are also kept on disk so restarts skip the resize
+THUMBNAIL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".thumbnail_cache")
+
+_lock = threading.Lock()
+_thumbnails = {}  # content key -> encoded bytes
+_sources = {}  # image path -> ((mtime, size), content key)
+
+
+def _content_key(data):
+    # Hash of the source image plus the rendering settings
+    settings = f"{THUMBNAIL_SIZE}-{THUMBNAIL_FORMAT}-{THUMBNAIL_QUALITY}".encode()
+    return hashlib.sha256(data + settings).hexdigest()[:32]
+
+
+def _render(data):
+    image = Image.open(io.BytesIO(data))
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    thumbnail = image.resize(THUMBNAIL_SIZE)  # Resize to a consistent size
+    output = io.BytesIO()
+    thumbnail.save(output, format=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+    return output.getvalue()
+
+
+def get_thumbnail(image_path):
+    """Return the encoded thumbnail bytes for an image, or ``None`` if the file is missing.
+
+    Thumbnails are rendered once per image content and then served from
+    memory (and from disk after a restart); a rerun only costs an ``os.stat``.
+    """
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        source = _sources.get(image_path)
+        if source and source[0] == signature and source[1] in _thumbnails:
+            return _thumbnails[source[1]]
+
+    with open(image_path, "rb") as f:
+        data = f.read()
+    key = _content_key(data)
+    cache_path = os.path.join(THUMBNAIL_CACHE_DIR, f"{key}.{THUMBNAIL_FORMAT.lower()}")
+
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            thumbnail = f.read()
+    else:
+        thumbnail = _render(data)
+        try:
+            os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+            # Write then rename so concurrent sessions never read a partial file
+            tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(thumbnail)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # The disk cache is optional; the in-memory copy is enough
+
+    with _lock:
+        _thumbnails[key] = thumbnail
+        _sources[image_path] = (signature, key)
+    return thumbnail
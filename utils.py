@@ -1,120 +1,77 @@
 # utils.py
 import streamlit as st
-from firebase_init import db
-from menu import menu
-import datetime
-import stripe
-
-# Securely set your Stripe secret key using st.secrets
-stripe.api_key = st.secrets["stripe"]["stripe_secret_key"]  # Ensure you have added your key to .streamlit/secrets.toml
+from branch_inventory import InsufficientInventoryError, find_inventory_shortfall, get_branch_inventory
+from order_service import build_order, deduct_branch_inventory
+from order_outbox import get_order_outbox
+from stripe_catalog import get_stripe_catalog
+from stripe_client import stripe
 
 def validate_branch_inventory(cart, branch_id):
-    # Fetch branch-specific inventory
-    branch_ref = db.collection("branches").document(branch_id).get()
-    branch_data = branch_ref.to_dict()
+    # Fetch branch-specific inventory (summed across shards and briefly cached)
+    inventory = get_branch_inventory(branch_id)
 
-    if not branch_data:
+    if inventory is None:
         st.error("Branch not found. Please contact admin.")
         return False
 
-    inventory = branch_data.get("inventory", {})
-
-    # Check each item in the cart
-    for item in cart:
-        coffee = item["coffee"]
-        quantity = item["quantity"]
-        requirements = menu[coffee]["requirements"]
-
-        # Check if inventory is sufficient for all requirements
-        for required_item, required_quantity in requirements.items():
-            if inventory.get(required_item, 0) < required_quantity * quantity:
-                st.error(
-                    f"Insufficient stock for {required_item} to fulfill {quantity}x {coffee}. "
-                    f"Available: {inventory.get(required_item, 0)}, Needed: {required_quantity * quantity}"
-                )
-                return False  # Return False if any inventory item is insufficient
+    shortfall = find_inventory_shortfall(cart, inventory)
+    if shortfall:
+        st.error(shortfall)
+        return False  # Return False if any inventory item is insufficient
 
     return True  # Return True if all inventory requirements are met
 
+
 def save_order_to_firestore(cart, customer, branch_id):
     try:
-        order_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        total_price = sum(
-            menu[item["coffee"]]["price"] * item["quantity"] for item in cart
-        )
-        total_cost = sum(
-            menu[item["coffee"]]["cost"] * item["quantity"] for item in cart
-        )
-        total_quantity = sum(item["quantity"] for item in cart)
-
-        order_data = {
-            "customer": customer,
-            "branch_id": branch_id,
-            "items": cart,  # Save all items in the cart under 'items'
-            "total_quantity": total_quantity,
-            "total_price": total_price,
-            "total_cost": total_cost,
-            "order_time": order_time,
-            "prepared_time": None,  # To be updated when the order is prepared
-        }
-        # Add the order data as a single document
-        db.collection("orders").add(order_data)
-
-        # Update the branch inventory based on the order
-        update_branch_inventory(cart, branch_id)
+        # Queue the order; the outbox commits it with its inventory deduction and sales rollup
+        return get_order_outbox().enqueue(build_order(cart, customer, branch_id))
+    except InsufficientInventoryError as e:
+        st.error(str(e))
     except Exception as e:
         st.error(f"Error saving order: {str(e)}")
 
+
 def update_branch_inventory(cart, branch_id):
     try:
-        # Fetch the branch's inventory
-        branch_ref = db.collection("branches").document(branch_id)
-        branch_doc = branch_ref.get()
-
-        if branch_doc.exists:
-            branch_data = branch_doc.to_dict()
-            inventory = branch_data.get("inventory", {})
-
-            # Deduct items from the inventory based on the order
-            for item in cart:
-                coffee = item["coffee"]
-                quantity = item["quantity"]
-                requirements = menu[coffee]["requirements"]
-
-                for ingredient, required_quantity in requirements.items():
-                    if ingredient in inventory:
-                        inventory[ingredient] = max(
-                            inventory[ingredient] - (required_quantity * quantity), 0
-                        )  # Ensure stock doesn't go below 0
-                    else:
-                        # Ingredient not in inventory
-                        st.error(f"Ingredient '{ingredient}' not found in inventory for branch '{branch_id}'.")
-                        return
-
-            # Update the inventory in Firestore
-            branch_ref.update({"inventory": inventory})
-        else:
-            st.error(f"Branch with ID '{branch_id}' not found.")
+        # Deduct items from the branch inventory without racing concurrent checkouts
+        deduct_branch_inventory(cart, branch_id)
+    except InsufficientInventoryError as e:
+        st.error(str(e))
     except Exception as e:
         st.error(f"Error updating inventory: {str(e)}")
 
-def create_checkout_session(cart, total_price, YOUR_DOMAIN):
-    # Build line items for Stripe Checkout
-    line_items = []
-    for item in cart:
-        line_items.append({
-            "price_data": {
-                "currency": "myr",
-                "product_data": {"name": item["coffee"]},
-                "unit_amount": int(menu[item["coffee"]]["price"] * 100),  # Amount in cents
-            },
-            "quantity": item["quantity"],
-        })
+def create_checkout_session(cart, YOUR_DOMAIN, discounts=None, order_id=None):
+    """Create a Stripe Checkout session for ``cart`` in a single Stripe call.
+
+    Line items reference the cached per-item Stripe Prices; ``discounts`` maps
+    a coffee to its percentage off. ``order_id`` is attached so payments can
+    be matched back to the order later.
+    """
+    line_items = get_stripe_catalog().line_items(cart, discounts)
     session = stripe.checkout.Session.create(
         payment_method_types=["card"],
         line_items=line_items,
         mode="payment",
         success_url=YOUR_DOMAIN + '?session_id={CHECKOUT_SESSION_ID}',
         cancel_url=YOUR_DOMAIN + '?canceled=true',
+        client_reference_id=order_id,
+        metadata={"order_id": order_id} if order_id else {},
     )
     return session
+
+
+def cancel_checkout_session(session_id):
+    """Stop payment for a Checkout session: expire it while open, refund it once paid.
+
+    Returns "expired", "refunded" or, when there was nothing to stop, the
+    session's status.
+    """
+    session = stripe.checkout.Session.retrieve(session_id)
+    if session.status == "open":
+        stripe.checkout.Session.expire(session_id)
+        return "expired"
+    if session.payment_status == "paid" and session.payment_intent:
+        stripe.Refund.create(payment_intent=session.payment_intent)
+        return "refunded"
+    return session.status